@@ -4,15 +4,34 @@ import folium
 from streamlit_folium import folium_static
 from pykml import parser
 import os
-from io import StringIO
+from io import StringIO, BytesIO
 import xml.etree.ElementTree as ET
 import zipfile
+import struct
+import re
+from array import array
 from geopy.distance import geodesic
+import numpy as np
+import pandas as pd
+import altair as alt
+import pyarrow as pa
+import pyarrow.parquet as pq
 import json
 import math
 import pickle
 import json
+import sys
+import time
+import logging
+import threading
+import weakref
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
+from kml_render import render_placemark
+
+logger = logging.getLogger(__name__)
 
 def segment_to_dict(segment):
     """将 Segment 对象转换为字典"""
@@ -74,17 +93,162 @@ def load_session_state(file_path):
     st.session_state.map_center = save_data['map_center']
     st.session_state.has_uploaded = save_data['has_uploaded']
 
+# 冷数据压缩精度：经纬度 1e-6 度（约 0.1 米），海拔 0.1 米
+COORD_SCALE = 1e6
+ELEVATION_SCALE = 10
+DELTA_DTYPES = [np.int8, np.int16, np.int32, np.int64]
+
+def pack_track(coordinates, elevations):
+	"""把轨迹点量化为定点整数并做差分编码，打包为 bytes
+
+	格式：点数 (uint32)，然后依次是纬度、经度、海拔三列；每列为 1 字节
+	差分宽度、int64 首值和 n-1 个差分值。
+	"""
+	coords = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+	columns = [
+		np.round(coords[:, 0] * COORD_SCALE).astype(np.int64),
+		np.round(coords[:, 1] * COORD_SCALE).astype(np.int64),
+		np.round(np.asarray(elevations, dtype=np.float64) * ELEVATION_SCALE).astype(np.int64),
+	]
+	parts = [np.uint32(len(coords)).tobytes()]
+	for column in columns:
+		deltas = np.diff(column)
+		# 选择能容纳所有差分的最窄整数类型
+		dtype = next(dt for dt in DELTA_DTYPES
+					 if len(deltas) == 0 or (deltas.min() >= np.iinfo(dt).min and deltas.max() <= np.iinfo(dt).max))
+		parts.append(np.uint8(np.dtype(dtype).itemsize).tobytes())
+		parts.append(column[:1].tobytes() if len(column) else np.int64(0).tobytes())
+		parts.append(deltas.astype(dtype).tobytes())
+	return b''.join(parts)
+
+def unpack_track(packed):
+	"""解码 pack_track 的结果，返回纬度、经度、海拔 numpy 数组"""
+	n = int(np.frombuffer(packed, dtype=np.uint32, count=1)[0])
+	offset = 4
+	columns = []
+	for scale in (COORD_SCALE, COORD_SCALE, ELEVATION_SCALE):
+		width = packed[offset]
+		first = np.frombuffer(packed, dtype=np.int64, count=1, offset=offset + 1)
+		dtype = next(dt for dt in DELTA_DTYPES if np.dtype(dt).itemsize == width)
+		count = max(n - 1, 0)
+		deltas = np.frombuffer(packed, dtype=dtype, count=count, offset=offset + 9)
+		offset += 9 + count * width
+		values = np.empty(n, dtype=np.int64)
+		if n:
+			values[0] = first[0]
+			np.cumsum(deltas, out=values[1:])
+			values[1:] += first[0]
+		columns.append(values / scale)
+	return columns[0], columns[1], columns[2]
+
 class Segment:
 	def __init__(self, name, coordinates, elevations, order):
 		self.name = name
-		self.coordinates = coordinates
-		self.elevations = elevations
+		self._coordinates = coordinates
+		self._elevations = elevations
+		self._packed = None  # 压缩后的轨迹点，见 compress()
+		self._packed_count = 0
 		self.selected = False
 		self.split_point_index = len(coordinates) // 2  # 默认在中间
 		self.order = order
+		self.version = 0  # 每次修改轨迹点后递增，用于缓存失效
+		self._cache = {}
+	
+	@property
+	def coordinates(self):
+		if self._packed is not None:
+			self.decompress()
+		return self._coordinates
+	
+	@coordinates.setter
+	def coordinates(self, value):
+		if self._packed is not None:
+			self.decompress()
+		self._coordinates = value
+	
+	@property
+	def elevations(self):
+		if self._packed is not None:
+			self.decompress()
+		return self._elevations
+	
+	@elevations.setter
+	def elevations(self, value):
+		if self._packed is not None:
+			self.decompress()
+		self._elevations = value
+	
+	@property
+	def point_count(self):
+		"""轨迹点数，不触发解压"""
+		return self._packed_count if self._packed is not None else len(self._coordinates)
+	
+	@property
+	def compressed(self):
+		return self._packed is not None
+	
+	def compress(self):
+		"""压缩轨迹点并释放体积较大的缓存，用于未选中的冷数据"""
+		if self._packed is None:
+			self._packed = pack_track(self._coordinates, self._elevations)
+			self._packed_count = len(self._coordinates)
+			self._coordinates = None
+			self._elevations = None
+		# 只保留体积很小的统计缓存；KML 片段比压缩后的轨迹点大一个数量级，导出时再重新渲染
+		for key in [key for key in self._cache if key != 'metrics']:
+			del self._cache[key]
+	
+	def decompress(self):
+		"""恢复为完整精度的列表（经过一次量化）"""
+		lat, lon, ele = unpack_track(self._packed)
+		self._coordinates = np.column_stack((lat, lon)).tolist()
+		self._elevations = ele.tolist()
+		self._packed = None
+	
+	def point_arrays(self):
+		"""纬度、经度、海拔 numpy 数组；已压缩时直接解码，不恢复为列表"""
+		if self._packed is not None:
+			return unpack_track(self._packed)
+		coords = np.asarray(self._coordinates, dtype=np.float64).reshape(-1, 2)
+		return coords[:, 0], coords[:, 1], np.asarray(self._elevations, dtype=np.float64)
+	
+	def polyline(self):
+		"""用于地图折线的 [lat, lon] 列表"""
+		if self._packed is not None:
+			lat, lon, _ = unpack_track(self._packed)
+			return np.column_stack((lat, lon)).tolist()
+		return self._coordinates
+	
+	@classmethod
+	def from_arrays(cls, name, lat, lon, elevations, order):
+		"""直接由 numpy 数组创建压缩状态的轨迹段，不经过 Python 列表"""
+		segment = cls(name, [], [], order)
+		segment._packed = pack_track(np.column_stack((lat, lon)), elevations)
+		segment._packed_count = len(lat)
+		segment._coordinates = None
+		segment._elevations = None
+		segment.split_point_index = len(lat) // 2
+		return segment
+	
+	def mark_modified(self):
+		"""轨迹点被修改后调用，使所有派生数据的缓存失效"""
+		self.version += 1
+		self._cache.clear()
+	
+	def clear_cache(self):
+		"""释放派生数据缓存，下次使用时重新计算"""
+		self._cache.clear()
+	
+	def get_cached(self, key, compute):
+		"""按版本号缓存派生数据，版本变化时重新计算"""
+		entry = self._cache.get(key)
+		if entry is None or entry[0] != self.version:
+			entry = (self.version, compute())
+			self._cache[key] = entry
+		return entry[1]
 	
 	def __repr__(self):
-		return f"Segment({self.name}, {len(self.coordinates)} points, order={self.order})"
+		return f"Segment({self.name}, {self.point_count} points, order={self.order})"
 
 class SegmentManager:
 	def __init__(self):
@@ -123,9 +287,35 @@ class SegmentManager:
 			st.session_state.file_names.add(name)  # 仍然记录文件名以防重复上传
 			self.update_segment_orders()
 
+	def add_imported_segments(self, name, segments):
+		"""添加从列式文件导入的轨迹段，保留原名称"""
+		if name not in st.session_state.file_names:
+			st.session_state.segments.extend(segments)
+			st.session_state.file_names.add(name)
+			self.update_segment_orders()
+
 	def get_segments(self):
-		# 按 order 排序返回
-		return sorted(st.session_state.segments, key=lambda x: x.order)
+		# 列表位置即 order（见 update_segment_orders），直接返回副本
+		return list(st.session_state.segments)
+
+	def get_segment_by_order(self, order):
+		"""按 order 直接索引轨迹段，无需线性扫描"""
+		segment = st.session_state.segments[order]
+		if segment.order != order:
+			raise RuntimeError("段列表顺序与 order 不一致")
+		return segment
+
+	def segment_index(self, segment):
+		"""返回轨迹段在段列表中的位置，并确认该位置上确实是这个段"""
+		if self.get_segment_by_order(segment.order) is not segment:
+			raise RuntimeError(f"轨迹段 {segment.name} 不在段列表中")
+		return segment.order
+
+	def compress_cold_segments(self):
+		"""压缩所有未选中的轨迹段，选中或导出时再按需解压"""
+		for segment in st.session_state.segments:
+			if not segment.selected:
+				segment.compress()
 
 	def clear_segments(self):
 		st.session_state.segments = []
@@ -147,11 +337,13 @@ class SegmentManager:
 			segment.coordinates = segment.coordinates[step:]
 			segment.elevations = segment.elevations[step:]
 			segment.split_point_index = max(0, segment.split_point_index - step)
+			segment.mark_modified()
 		elif direction == 'end_backward':
 			# 终点向前移动 step 个点
 			segment.coordinates = segment.coordinates[:-step]
 			segment.elevations = segment.elevations[:-step]
 			segment.split_point_index = min(segment.split_point_index, len(segment.coordinates) - 1)
+			segment.mark_modified()
 	
 	def reverse_segment(self, segment):
 		"""反转轨迹段的方向"""
@@ -160,11 +352,12 @@ class SegmentManager:
 		segment.elevations.reverse()
 		# 更新分裂点位置
 		segment.split_point_index = len(segment.coordinates) - 1 - segment.split_point_index
+		segment.mark_modified()
 	
 	def delete_segment(self, segment):
 		"""删除轨迹段"""
 		# 从段列表中移除
-		st.session_state.segments = [s for s in st.session_state.segments if s.order != segment.order]
+		del st.session_state.segments[self.segment_index(segment)]
 		self.update_segment_orders()
 	
 	def duplicate_segment(self, segment):
@@ -199,7 +392,7 @@ class SegmentManager:
 		second_elevs = segment.elevations[segment.split_point_index:]
 		
 		# 从段列表中移除原始段
-		st.session_state.segments = [s for s in st.session_state.segments if s.order != segment.order]
+		del st.session_state.segments[self.segment_index(segment)]
 		
 		# 创建并添加新段
 		first_segment = Segment(self.get_next_segment_name(), first_coords, first_elevs, 0)
@@ -215,11 +408,8 @@ class SegmentManager:
 
 	def move_segment(self, from_order, to_order):
 		if 0 <= from_order < len(st.session_state.segments) and 0 <= to_order < len(st.session_state.segments):
-			# 获取要移动的段
-			segment_to_move = next(s for s in st.session_state.segments if s.order == from_order)
-			
-			# 从列表中移除该段
-			st.session_state.segments.remove(segment_to_move)
+			# 获取并移除要移动的段（order 即列表下标）
+			segment_to_move = st.session_state.segments.pop(from_order)
 			
 			# 在新位置插入该段
 			st.session_state.segments.insert(to_order, segment_to_move)
@@ -227,94 +417,1248 @@ class SegmentManager:
 			# 更新所有段的顺序
 			self.update_segment_orders()
 
-def parse_kml(file):
-	"""解析KML文件并提取坐标点"""
-	coordinates = []
-	elevations = []
+class PointBuffer:
+	"""导入器共用的数值轨迹点缓冲区，按列存放 float64，不为每个点创建 Python 列表"""
+	def __init__(self):
+		self.lat = array('d')
+		self.lon = array('d')
+		self.ele = array('d')
 	
-	# 检查是否为KMZ文件
-	if file.name.lower().endswith('.kmz'):
-		# 创建临时文件来保存上传的内容
-		with open("temp.kmz", "wb") as f:
-			f.write(file.getvalue())
-		
-		# 解压KMZ文件
-		with zipfile.ZipFile("temp.kmz", 'r') as zip_ref:
-			kml_file = None
-			for name in zip_ref.namelist():
-				if name.lower().endswith('.kml'):
-					kml_file = zip_ref.extract(name)
-					break
-			
-			if kml_file is None:
-				st.error("KMZ文件中未找到KML文件")
-				return [], []
-			
-			with open(kml_file, 'r', encoding='utf-8') as f:
-				content = f.read()
-			
-			# 清理临时文件
-			os.remove(kml_file)
-	else:
-		# 直接读取KML文件
-		content = file.getvalue().decode('utf-8')
+	def __len__(self):
+		return len(self.lat)
 	
-	# 解析KML内容
-	root = ET.fromstring(content)
+	def append(self, lat, lon, ele):
+		self.lat.append(lat)
+		self.lon.append(lon)
+		self.ele.append(ele)
 	
-	# 注册命名空间
-	namespaces = {
-		'gx': 'http://www.google.com/kml/ext/2.2',
-		'kml': 'http://www.opengis.net/kml/2.2'
-	}
+	def extend(self, lat, lon, ele):
+		"""追加 numpy 数组形式的一批轨迹点"""
+		self.lat.frombytes(np.ascontiguousarray(lat, dtype=np.float64).tobytes())
+		self.lon.frombytes(np.ascontiguousarray(lon, dtype=np.float64).tobytes())
+		self.ele.frombytes(np.ascontiguousarray(ele, dtype=np.float64).tobytes())
 	
-	# 首先尝试查找 gx:Track 中的 gx:coord
-	tracks = root.findall('.//gx:Track', namespaces)
-	
-	if tracks:
-		# 如果找到 gx:Track，解析其中的 gx:coord
-		for track in tracks:
-			coords = track.findall('gx:coord', namespaces)
-			for coord in coords:
-				# gx:coord 格式为: "longitude latitude altitude"
-				lon, lat, ele = coord.text.strip().split()
-				coordinates.append([float(lat), float(lon)])
-				elevations.append(float(ele))
-	else:
-		# 如果没有找到 gx:Track，尝试解析传统的 coordinates 标签
-		for elem in root.iter('*'):
-			if 'coordinates' in elem.tag:
-				coords_text = elem.text.strip()
-				coord_pairs = coords_text.split()
-				
-				for pair in coord_pairs:
-					# coordinates 格式为: "longitude,latitude,altitude"
-					lon, lat, ele = pair.split(',')
-					coordinates.append([float(lat), float(lon)])
-					elevations.append(float(ele))
+	def extend_buffer(self, other):
+		self.lat.extend(other.lat)
+		self.lon.extend(other.lon)
+		self.ele.extend(other.ele)
 	
-	# 清理临时文件
-	if file.name.lower().endswith('.kmz'):
-		os.remove("temp.kmz")
+	def arrays(self):
+		"""纬度、经度、海拔 numpy 数组（共享缓冲区内存）"""
+		return (np.frombuffer(self.lat, dtype=np.float64), np.frombuffer(self.lon, dtype=np.float64),
+				np.frombuffer(self.ele, dtype=np.float64))
 	
-	if not coordinates:
+	def to_lists(self):
+		"""转换为 Segment 使用的坐标列表和海拔列表"""
+		lat, lon, ele = self.arrays()
+		return np.column_stack((lat, lon)).tolist(), ele.tolist()
+
+def local_tag(tag):
+	"""去掉命名空间的标签名"""
+	return tag.rpartition('}')[2]
+
+def iter_elements(data):
+	"""流式遍历 XML 元素的结束事件，元素处理完后立即从父元素中删除，内存不随文件增长"""
+	stack = []
+	for event, elem in ET.iterparse(BytesIO(data), events=('start', 'end')):
+		if event == 'start':
+			stack.append(elem)
+			continue
+		stack.pop()
+		yield elem
+		if stack:
+			del stack[-1][-1]
+
+KML_COMMA_SPACES = re.compile(r'\s*,\s*')
+
+def parse_kml(data, points):
+	"""解析KML并写入轨迹点缓冲区
+
+	优先使用 gx:Track 中的 gx:coord；没有 gx:Track 时解析传统的 coordinates 标签。
+	"""
+	fallback = PointBuffer()
+	has_track = False
+	for elem in iter_elements(data):
+		tag = local_tag(elem.tag)
+		if tag == 'coord':
+			# gx:coord 格式为: "longitude latitude altitude"
+			lon, lat, ele = elem.text.split()
+			points.append(float(lat), float(lon), float(ele))
+		elif tag == 'Track':
+			has_track = True
+		elif tag == 'coordinates' and not has_track and elem.text:
+			# coordinates 格式为: "longitude,latitude[,altitude]"，元组间以空白分隔，缺少海拔时记为 0
+			values = np.array(elem.text.replace(',', ' ').split(), dtype=np.float64)
+			# 每个元组的数值比逗号多一个，由此得到元组数；逗号两侧有空白时同样成立
+			count = len(values) - elem.text.count(',')
+			if count <= 0:
+				continue
+			dims = len(values) // count
+			if dims * count != len(values) or dims not in (2, 3):
+				# 二维、三维坐标混用，去掉逗号两侧的空白后逐个元组解析
+				values = np.array([(float(c[0]), float(c[1]), float(c[2]) if len(c) > 2 else 0.0)
+								   for c in (t.split(',') for t in KML_COMMA_SPACES.sub(',', elem.text).split())],
+								  dtype=np.float64)
+				dims = 3
+			values = values.reshape(-1, dims)
+			fallback.extend(values[:, 1], values[:, 0], values[:, 2] if dims > 2 else np.zeros(len(values)))
+	if not has_track:
+		points.extend_buffer(fallback)
+
+def parse_kmz(data, points):
+	"""在内存中解压KMZ，解析其中第一个KML文件"""
+	with zipfile.ZipFile(BytesIO(data), 'r') as zip_ref:
+		kml_name = next((name for name in zip_ref.namelist() if name.lower().endswith('.kml')), None)
+		if kml_name is None:
+			raise ValueError("KMZ文件中未找到KML文件")
+		parse_kml(zip_ref.read(kml_name), points)
+
+def parse_gpx(data, points):
+	"""流式解析GPX的航迹点；没有航迹点时使用航线点，缺少海拔时记为 0"""
+	fallback = PointBuffer()
+	ele = 0.0
+	for elem in iter_elements(data):
+		tag = local_tag(elem.tag)
+		if tag == 'ele':
+			ele = float(elem.text)
+		elif tag == 'trkpt':
+			points.append(float(elem.get('lat')), float(elem.get('lon')), ele)
+			ele = 0.0
+		elif tag == 'rtept':
+			fallback.append(float(elem.get('lat')), float(elem.get('lon')), ele)
+			ele = 0.0
+		elif tag == 'wpt':
+			# 航点不导入，但它的海拔不能带到下一个轨迹点
+			ele = 0.0
+	if not len(points):
+		points.extend_buffer(fallback)
+
+JSON_WHITESPACE = re.compile(r'\s*')
+
+def add_geojson_geometry(obj, points):
+	"""把 GeoJSON 对象中的线要素写入轨迹点缓冲区，缺少海拔时记为 0"""
+	kind = obj.get('type')
+	if kind == 'Feature':
+		if obj.get('geometry'):
+			add_geojson_geometry(obj['geometry'], points)
+	elif kind == 'FeatureCollection':
+		for feature in obj.get('features', []):
+			add_geojson_geometry(feature, points)
+	elif kind == 'GeometryCollection':
+		for geometry in obj.get('geometries', []):
+			add_geojson_geometry(geometry, points)
+	elif kind in ('LineString', 'MultiLineString'):
+		lines = [obj['coordinates']] if kind == 'LineString' else obj['coordinates']
+		for line in lines:
+			if not line:
+				continue
+			try:
+				values = np.array(line, dtype=np.float64)
+			except ValueError:
+				# 二维、三维坐标混用
+				values = np.array([(c[0], c[1], c[2] if len(c) > 2 else 0.0) for c in line], dtype=np.float64)
+			ele = values[:, 2] if values.shape[1] > 2 else np.zeros(len(values))
+			points.extend(values[:, 1], values[:, 0], ele)
+
+def parse_geojson(data, points):
+	"""流式解析GeoJSON
+
+	顶层 FeatureCollection 的 features 数组逐个要素解码，不构建整个文档的对象树；
+	其他顶层对象（Feature、几何对象）整体解码。
+	"""
+	text = data.decode('utf-8-sig')
+	decoder = json.JSONDecoder()
+	pos = JSON_WHITESPACE.match(text, 0).end()
+	if text[pos:pos + 1] != '{':
+		raise ValueError("GeoJSON顶层必须是对象")
+	pos += 1
+	obj = {}
+	streamed = False
+	while True:
+		pos = JSON_WHITESPACE.match(text, pos).end()
+		if text[pos] == '}':
+			break
+		if text[pos] == ',':
+			pos += 1
+			continue
+		key, pos = decoder.raw_decode(text, pos)
+		pos = JSON_WHITESPACE.match(text, pos).end()
+		if text[pos] != ':':
+			raise ValueError(f"GeoJSON格式错误（位置 {pos}）")
+		pos = JSON_WHITESPACE.match(text, pos + 1).end()
+		if key == 'features' and text[pos] == '[':
+			# 逐个解码要素
+			streamed = True
+			pos += 1
+			while True:
+				pos = JSON_WHITESPACE.match(text, pos).end()
+				if text[pos] == ']':
+					pos += 1
+					break
+				if text[pos] == ',':
+					pos += 1
+					continue
+				feature, pos = decoder.raw_decode(text, pos)
+				add_geojson_geometry(feature, points)
+		else:
+			obj[key], pos = decoder.raw_decode(text, pos)
+	if not streamed:
+		add_geojson_geometry(obj, points)
+
+# FIT 文件中 record 消息（全局编号 20）的位置和海拔字段：字段号 -> (名称, 字节数, struct 格式)
+FIT_RECORD_MESSAGE = 20
+FIT_RECORD_FIELDS = {
+	0: ('lat', 4, 'i'),
+	1: ('lon', 4, 'i'),
+	2: ('altitude', 2, 'H'),
+	78: ('enhanced_altitude', 4, 'I'),
+}
+FIT_INVALID = {'lat': 0x7FFFFFFF, 'lon': 0x7FFFFFFF, 'altitude': 0xFFFF, 'enhanced_altitude': 0xFFFFFFFF}
+FIT_SEMICIRCLE = 180.0 / 2 ** 31  # 半圆单位换算为度
+
+def fit_definition(data, pos, developer):
+	"""解析定义消息，返回 (全局消息号, 预编译的 struct, 字段名列表, 新位置)
+
+	只有 record 消息中的位置和海拔字段会被解包，其余字段用填充字节跳过。
+	"""
+	big_endian = data[pos + 1] == 1
+	global_number = struct.unpack_from('>H' if big_endian else '<H', data, pos + 2)[0]
+	field_count = data[pos + 4]
+	pos += 5
+	fmt = '>' if big_endian else '<'
+	names = []
+	for i in range(field_count):
+		number, size = data[pos], data[pos + 1]
+		pos += 3
+		field = FIT_RECORD_FIELDS.get(number) if global_number == FIT_RECORD_MESSAGE else None
+		if field is not None and field[1] == size:
+			fmt += field[2]
+			names.append(field[0])
+		else:
+			fmt += f'{size}x'
+	if developer:
+		developer_count = data[pos]
+		pos += 1
+		for i in range(developer_count):
+			fmt += f'{data[pos + 1]}x'
+			pos += 3
+	return global_number, struct.Struct(fmt), names, pos
+
+def parse_fit(data, points):
+	"""纯 Python 解码 FIT 文件中 record 消息的位置和海拔，支持多个文件首尾相接"""
+	start = 0
+	while len(data) - start >= 12:
+		header_size = data[start]
+		data_size = struct.unpack_from('<I', data, start + 4)[0]
+		if data[start + 8:start + 12] != b'.FIT':
+			raise ValueError("不是有效的FIT文件")
+		pos = start + header_size
+		end = pos + data_size
+		definitions = {}
+		while pos < end:
+			header = data[pos]
+			pos += 1
+			if header & 0x80:
+				# 压缩时间戳头，本地消息类型在第 5、6 位
+				local = (header >> 5) & 0x03
+			elif header & 0x40:
+				global_number, layout, names, pos = fit_definition(data, pos, header & 0x20)
+				definitions[header & 0x0F] = (global_number, layout, names)
+				continue
+			else:
+				local = header & 0x0F
+			if local not in definitions:
+				raise ValueError(f"FIT数据消息缺少定义（位置 {pos - 1}）")
+			global_number, layout, names = definitions[local]
+			if global_number == FIT_RECORD_MESSAGE and names:
+				values = dict(zip(names, layout.unpack_from(data, pos)))
+				lat = values.get('lat', FIT_INVALID['lat'])
+				lon = values.get('lon', FIT_INVALID['lon'])
+				if lat != FIT_INVALID['lat'] and lon != FIT_INVALID['lon']:
+					altitude = values.get('enhanced_altitude', FIT_INVALID['enhanced_altitude'])
+					if altitude == FIT_INVALID['enhanced_altitude']:
+						altitude = values.get('altitude', FIT_INVALID['altitude'])
+						altitude = None if altitude == FIT_INVALID['altitude'] else altitude
+					ele = altitude / 5.0 - 500.0 if altitude is not None else 0.0
+					points.append(lat * FIT_SEMICIRCLE, lon * FIT_SEMICIRCLE, ele)
+			pos += layout.size
+		# 跳过文件末尾 2 字节 CRC
+		start = end + 2
+
+# 轨迹导入器：文件扩展名 -> 解析函数，解析函数把轨迹点写入 PointBuffer
+TRACK_IMPORTERS = {
+	'.kml': parse_kml,
+	'.kmz': parse_kmz,
+	'.gpx': parse_gpx,
+	'.geojson': parse_geojson,
+	'.json': parse_geojson,
+	'.fit': parse_fit,
+}
+
+def import_track(file):
+	"""按扩展名选择导入器解析上传的轨迹文件，返回 PointBuffer；没有轨迹点时显示警告"""
+	extension = os.path.splitext(file.name)[1].lower()
+	importer = TRACK_IMPORTERS.get(extension)
+	if importer is None:
+		st.error(f"不支持的文件格式：{extension}")
+		return PointBuffer()
+	points = PointBuffer()
+	importer(file.getvalue(), points)
+	if not len(points):
 		st.warning("未找到任何轨迹点数据")
-		return [], []
-		
-	return coordinates, elevations
+	return points
 
 def calculate_distance(coord1, coord2):
 	"""计算两点之间的距离（米）"""
 	return geodesic(coord1, coord2).meters
 
-def export_to_kml(segments):
-	"""将所有轨迹段导出为KML格式"""
-	# 创建KML文档
-	kml_str = """<?xml version="1.0" encoding="UTF-8"?>
+EARTH_RADIUS = 6371008.8  # 地球平均半径（米）
+
+# GPS 过滤参数
+FILTER_SPIKE_RATIO = 3.0      # 经过某点的绕行距离超过前后两点直连距离的该倍数时视为离群
+FILTER_SPIKE_STEPS = 5.0      # 且该点前后两段都超过中位点距的该倍数，避免稀疏轨迹被误删
+FILTER_MEDIAN_WINDOW = 5      # 海拔中值滤波窗口（点数，奇数）
+FILTER_HYSTERESIS = 3.0       # 累计爬升/下降的滞回阈值（米）
+FILTER_CHUNK_SIZE = 1_000_000 # 中值滤波分块大小，限制超长轨迹的临时内存
+
+def segment_arrays(segment):
+	"""返回轨迹段的纬度、经度、海拔 numpy 数组（按版本缓存）"""
+	return segment.get_cached('arrays', segment.point_arrays)
+
+def haversine_distances(lat1, lon1, lat2, lon2):
+	"""向量化计算两组点之间的球面距离（米）"""
+	lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+	a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+	return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def step_distances(lat, lon):
+	"""相邻点之间的距离数组，长度为 n-1"""
+	return haversine_distances(lat[:-1], lon[:-1], lat[1:], lon[1:])
+
+def cumulative_distances(segment):
+	"""每个点距起点的累计距离（米，按版本缓存）"""
+	def compute():
+		lat, lon, _ = segment_arrays(segment)
+		result = np.zeros(len(lat), dtype=np.float64)
+		if len(lat) > 1:
+			np.cumsum(step_distances(lat, lon), out=result[1:])
+		return result
+	return segment.get_cached('cumulative_distances', compute)
+
+def median_smooth(values, window=FILTER_MEDIAN_WINDOW):
+	"""滑动中值滤波，边界用端点值填充，分块处理以控制内存"""
+	n = len(values)
+	if n < 3 or window < 3:
+		return values.copy()
+	half = window // 2
+	padded = np.pad(values, half, mode='edge')
+	windows = np.lib.stride_tricks.sliding_window_view(padded, window)
+	result = np.empty(n, dtype=np.float64)
+	for start in range(0, n, FILTER_CHUNK_SIZE):
+		end = min(start + FILTER_CHUNK_SIZE, n)
+		result[start:end] = np.median(windows[start:end], axis=1)
+	return result
+
+def hysteresis_changes(elevations, threshold=FILTER_HYSTERESIS):
+	"""带滞回阈值的海拔变化，返回 (计入变化的点下标, 变化量)，小于阈值的起伏不计入"""
+	if len(elevations) < 2:
+		return np.empty(0, dtype=np.int64), np.empty(0)
+	# 先把单调区间压缩为转折点，循环只需遍历极值点
+	diffs = np.diff(elevations)
+	signs = np.sign(diffs)
+	nonzero = np.flatnonzero(signs)
+	if len(nonzero) == 0:
+		return np.empty(0, dtype=np.int64), np.empty(0)
+	signs = signs[nonzero]
+	turns = nonzero[1:][signs[1:] != signs[:-1]]
+	positions = np.concatenate(([0], turns, [len(elevations) - 1]))
+
+	indices = []
+	changes = []
+	reference = float(elevations[0])
+	for position, value in zip(positions[1:].tolist(), elevations[positions[1:]].tolist()):
+		if abs(value - reference) >= threshold:
+			indices.append(position)
+			changes.append(value - reference)
+			reference = value
+	return np.array(indices, dtype=np.int64), np.array(changes)
+
+def hysteresis_gain(elevations, threshold=FILTER_HYSTERESIS):
+	"""带滞回阈值的累计爬升和下降，小于阈值的起伏不计入"""
+	_, changes = hysteresis_changes(elevations, threshold)
+	return float(changes[changes > 0].sum()), float(np.abs(changes[changes < 0]).sum())
+
+def filter_segment(segment, spike_ratio=FILTER_SPIKE_RATIO, spike_steps=FILTER_SPIKE_STEPS,
+				   window=FILTER_MEDIAN_WINDOW, threshold=FILTER_HYSTERESIS):
+	"""过滤 GPS 跳点并平滑海拔，返回修正后的统计（按版本缓存）
+
+	轨迹中没有时间戳，无法按速度判断，因此按形状判断跳点：经过某点的绕行距离
+	d(i-1,i)+d(i,i+1) 超过直连距离 d(i-1,i+1) 的 spike_ratio 倍，且前后两段都超过
+	中位点距的 spike_steps 倍时剔除。阈值随轨迹自身点距缩放，稀疏轨迹不会被整体删除。
+	"""
+	def compute():
+		lat, lon, ele = segment_arrays(segment)
+		n = len(lat)
+		keep = np.ones(n, dtype=bool)
+		if n >= 3:
+			steps = step_distances(lat, lon)
+			direct = haversine_distances(lat[:-2], lon[:-2], lat[2:], lon[2:])
+			long_step = spike_steps * float(np.median(steps))
+			keep[1:-1] = ~((steps[:-1] + steps[1:] > spike_ratio * direct)
+						   & (steps[:-1] > long_step) & (steps[1:] > long_step))
+		smoothed = median_smooth(ele[keep], window)
+		ascent, descent = hysteresis_gain(smoothed, threshold)
+		return {
+			'mask': keep,
+			'elevations': smoothed,
+			'removed': int(n - keep.sum()),
+			'ascent': ascent,
+			'descent': descent,
+		}
+	return segment.get_cached(('filter', spike_ratio, spike_steps, window, threshold), compute)
+
+def km_statistics(segment):
+	"""每公里的距离、爬升和下降表格，最后一行为总计，均基于 filter_segment 的修正数据"""
+	lat, lon, _ = segment_arrays(segment)
+	filtered = filter_segment(segment)
+	mask = filtered['mask']
+	lat, lon = lat[mask], lon[mask]
+	distances = np.zeros(len(lat))
+	if len(lat) > 1:
+		np.cumsum(step_distances(lat, lon), out=distances[1:])
+	km = (distances // 1000).astype(np.int64)
+	# 每公里的最后一个点
+	kms, first = np.unique(km, return_index=True)
+	last = np.concatenate((first[1:] - 1, [len(km) - 1]))
+	ends = distances[last]
+	starts = np.concatenate(([0.0], ends[:-1]))
+
+	indices, changes = hysteresis_changes(filtered['elevations'])
+	bucket = np.searchsorted(kms, km[indices])
+	ascent = np.bincount(bucket, weights=np.maximum(changes, 0), minlength=len(kms))
+	descent = np.bincount(bucket, weights=np.maximum(-changes, 0), minlength=len(kms))
+
+	rows = [{
+		"公里数": f"第{k + 1}公里",
+		"实际距离": f"{end - start:.0f}m",
+		"爬升": f"{up:.1f}m",
+		"下降": f"{down:.1f}m"
+	} for k, start, end, up, down in zip(kms.tolist(), starts.tolist(), ends.tolist(), ascent.tolist(), descent.tolist())]
+	rows.append({
+		"公里数": "总计",
+		"实际距离": f"{distances[-1]:.0f}m",
+		"爬升": f"{filtered['ascent']:.1f}m",
+		"下降": f"{filtered['descent']:.1f}m"
+	})
+	return rows
+
+def segment_metrics(segment):
+	"""轨迹段的汇总统计：点数、距离（米）、修正后爬升和下降（按版本缓存）"""
+	def compute():
+		filtered = filter_segment(segment)
+		return {
+			'points': segment.point_count,
+			'distance': float(cumulative_distances(segment)[-1]) if segment.point_count else 0.0,
+			'ascent': filtered['ascent'],
+			'descent': filtered['descent'],
+		}
+	return segment.get_cached('metrics', compute)
+
+PROFILE_POINTS = 500  # 海拔剖面图显示的点数
+
+def lttb_indices(x, y, n_out):
+	"""Largest-Triangle-Three-Buckets 降采样，返回保留点的下标"""
+	n = len(x)
+	if n_out >= n or n_out < 3:
+		return np.arange(n)
+	# 首尾点固定保留，中间点平均分到 n_out - 2 个桶中
+	edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+	indices = np.empty(n_out, dtype=np.int64)
+	indices[0] = 0
+	indices[-1] = n - 1
+	selected = 0
+	for bucket in range(n_out - 2):
+		start, end = edges[bucket], edges[bucket + 1]
+		# 下一个桶的平均点（最后一个桶以终点为参照）
+		if bucket + 2 < len(edges):
+			next_start, next_end = edges[bucket + 1], edges[bucket + 2]
+			avg_x = x[next_start:next_end].mean()
+			avg_y = y[next_start:next_end].mean()
+		else:
+			avg_x, avg_y = x[-1], y[-1]
+		# 选出与上一个保留点、下一个桶平均点构成三角形面积最大的点
+		ax, ay = x[selected], y[selected]
+		areas = np.abs((ax - avg_x) * (y[start:end] - ay) - (ax - x[start:end]) * (avg_y - ay))
+		selected = start + int(np.argmax(areas))
+		indices[bucket + 1] = selected
+	return indices
+
+def elevation_profile(segment, n_out=PROFILE_POINTS):
+	"""降采样后的海拔-距离序列（按版本缓存），返回 (距离km, 海拔m)"""
+	def compute():
+		distances = cumulative_distances(segment) / 1000
+		_, _, elevations = segment_arrays(segment)
+		indices = lttb_indices(distances, elevations, n_out)
+		return distances[indices], elevations[indices]
+	return segment.get_cached(('profile', n_out), compute)
+
+def render_elevation_profile(segment):
+	"""显示海拔剖面图，并标出当前分裂点"""
+	distances, elevations = elevation_profile(segment)
+	profile = pd.DataFrame({'距离(km)': distances, '海拔(m)': elevations})
+	line = alt.Chart(profile).mark_line().encode(
+		x=alt.X('距离(km):Q'),
+		y=alt.Y('海拔(m):Q', scale=alt.Scale(zero=False))
+	)
+	split_distance = cumulative_distances(segment)[segment.split_point_index] / 1000
+	split_elevation = segment.elevations[segment.split_point_index]
+	split = pd.DataFrame({'距离(km)': [split_distance], '海拔(m)': [split_elevation]})
+	rule = alt.Chart(split).mark_rule(color='orange').encode(x='距离(km):Q')
+	point = alt.Chart(split).mark_point(color='orange', size=80, filled=True).encode(
+		x='距离(km):Q',
+		y='海拔(m):Q'
+	)
+	st.altair_chart(line + rule + point, use_container_width=True)
+
+# 轨迹对比参数
+COMPARE_TOLERANCE = 30.0          # 偏离判定阈值（米），超过视为两条轨迹分岔
+COMPARE_CHUNK_PAIRS = 1_000_000   # 网格查询每批候选点对上限，控制临时内存
+NEAREST_FANOUT = 32               # 最近点搜索中每个叶块的点数及每块的子块数
+NEAREST_CHUNK_PAIRS = 1_000_000   # 最近点搜索每批展开的候选对上限，控制临时内存
+FRECHET_MAX_CELLS = 5_000_000     # Fréchet 判定允许的最大候选单元数，超过时只给出上下界
+FRECHET_PROBES = (0.0, 1 / 16, 1 / 8, 1 / 4, 1 / 2, 1.0)  # 自由空间阈值在 [下界, 上界] 间的逐步放宽比例
+FRECHET_SAMPLE_STRIDE = 64        # 估计自由空间单元数时的查询点抽样间隔
+
+def project_points(lat, lon, lat0):
+	"""以 lat0 为基准做等距圆柱投影，返回以米为单位的平面坐标 (n, 2)"""
+	x = np.radians(lon) * EARTH_RADIUS * math.cos(math.radians(lat0))
+	y = np.radians(lat) * EARTH_RADIUS
+	return np.column_stack((x, y))
+
+def grid_pairs(query, ref, radius, max_candidates=None, max_pairs=None):
+	"""用均匀网格索引找出 query 与 ref 中距离不超过 radius 的所有点对
+
+	返回 (query 下标, ref 下标, 距离) 三个数组。网格边长等于 radius，
+	只需检查每个查询点周围 3x3 个格子。候选点对超过 max_candidates 时
+	不展开，结果点对超过 max_pairs 时停止展开，均返回 None。radius 为 0 时
+	无法划分网格，改为匹配坐标完全相同的点（见 equal_pairs）。
+	"""
+	if radius <= 0:
+		return equal_pairs(query, ref, max_pairs)
+	ref_cells = np.floor(ref / radius).astype(np.int64)
+	query_cells = np.floor(query / radius).astype(np.int64)
+	origin = ref_cells.min(axis=0) - 1
+	width = ref_cells[:, 1].max() - origin[1] + 2
+	height = ref_cells[:, 0].max() - origin[0] + 2
+	ref_keys = (ref_cells[:, 0] - origin[0]) * width + (ref_cells[:, 1] - origin[1])
+	order = np.argsort(ref_keys, kind='stable')
+	# 非空格子表：格子编号、在 order 中的起始位置和点数
+	cell_keys, cell_starts, cell_counts = np.unique(ref_keys[order], return_index=True, return_counts=True)
+
+	# 每个查询点在 9 个相邻格子中的候选区间
+	los, counts, owners = [], [], []
+	for dx in (-1, 0, 1):
+		for dy in (-1, 0, 1):
+			cx = query_cells[:, 0] + (dx - origin[0])
+			cy = query_cells[:, 1] + (dy - origin[1])
+			inside = np.flatnonzero((cx >= 0) & (cx <= height) & (cy >= 0) & (cy <= width))
+			keys = cx[inside] * width + cy[inside]
+			pos = np.minimum(np.searchsorted(cell_keys, keys), len(cell_keys) - 1)
+			hit = cell_keys[pos] == keys
+			los.append(cell_starts[pos[hit]])
+			counts.append(cell_counts[pos[hit]])
+			owners.append(inside[hit])
+	los = np.concatenate(los)
+	counts = np.concatenate(counts)
+	owners = np.concatenate(owners)
+	if max_candidates is not None and counts.sum() > max_candidates:
+		return None
+
+	# 分批展开候选点对，避免一次性占用过多内存
+	query_x, query_y = query[:, 0], query[:, 1]
+	ref_x, ref_y = ref[:, 0], ref[:, 1]
+	result_q, result_r, result_d = [], [], []
+	found = 0
+	ends = np.cumsum(counts)
+	start = 0
+	while start < len(counts):
+		base = ends[start - 1] if start > 0 else 0
+		stop = max(start + 1, int(np.searchsorted(ends, base + COMPARE_CHUNK_PAIRS, side='right')))
+		chunk_counts = counts[start:stop]
+		total = int(chunk_counts.sum())
+		offsets = np.repeat(np.cumsum(chunk_counts) - chunk_counts - los[start:stop], chunk_counts)
+		qi = np.repeat(owners[start:stop], chunk_counts)
+		rj = order[np.arange(total) - offsets]
+		ddx = query_x[qi] - ref_x[rj]
+		ddy = query_y[qi] - ref_y[rj]
+		d = np.sqrt(ddx * ddx + ddy * ddy)
+		close = np.flatnonzero(d <= radius)
+		result_q.append(qi[close])
+		result_r.append(rj[close])
+		result_d.append(d[close])
+		found += len(close)
+		if max_pairs is not None and found > max_pairs:
+			return None
+		start = stop
+	if not result_q:
+		empty = np.empty(0, dtype=np.int64)
+		return empty, empty, np.empty(0)
+	return np.concatenate(result_q), np.concatenate(result_r), np.concatenate(result_d)
+
+def equal_pairs(query, ref, max_pairs=None):
+	"""query 与 ref 中坐标完全相同的所有点对，返回格式同 grid_pairs
+
+	坐标编码为复数后排序（按实部、虚部字典序），每个查询点二分出相等的区间。
+	"""
+	order = np.argsort(ref[:, 0] + 1j * ref[:, 1], kind='stable')
+	ref_keys = ref[order, 0] + 1j * ref[order, 1]
+	query_keys = query[:, 0] + 1j * query[:, 1]
+	los = np.searchsorted(ref_keys, query_keys, side='left')
+	counts = np.searchsorted(ref_keys, query_keys, side='right') - los
+	total = int(counts.sum())
+	if max_pairs is not None and total > max_pairs:
+		return None
+	qi = np.repeat(np.arange(len(query)), counts)
+	rj = order[np.arange(total) - np.repeat(np.cumsum(counts) - counts - los, counts)]
+	return qi, rj, np.zeros(total)
+
+def point_blocks(points, size):
+	"""按下标把每 size 个连续点分为一块，返回 x、y 两个 (块数, size) 数组及每块的包围盒
+
+	末块用最后一个点补齐，重复的点不改变最近距离。轨迹点按行进顺序排列，
+	连续点在空间上也相邻，因此这些包围盒很紧凑。
+	"""
+	count = -(-len(points) // size) * size
+	padded = np.concatenate((points, np.repeat(points[-1:], count - len(points), axis=0))).reshape(-1, size, 2)
+	return (np.ascontiguousarray(padded[:, :, 0]), np.ascontiguousarray(padded[:, :, 1]),
+			padded.min(axis=1), padded.max(axis=1))
+
+def box_gaps(lo1, hi1, lo2, hi2):
+	"""两组包围盒之间的最短距离，相交时为 0"""
+	dx = np.maximum(np.maximum(lo2[:, 0] - hi1[:, 0], lo1[:, 0] - hi2[:, 0]), 0.0)
+	dy = np.maximum(np.maximum(lo2[:, 1] - hi1[:, 1], lo1[:, 1] - hi2[:, 1]), 0.0)
+	return np.hypot(dx, dy)
+
+def box_reaches(lo, hi, points):
+	"""包围盒内任意一点到对应点的最远距离"""
+	dx = np.maximum(np.abs(points[:, 0] - lo[:, 0]), np.abs(points[:, 0] - hi[:, 0]))
+	dy = np.maximum(np.abs(points[:, 1] - lo[:, 1]), np.abs(points[:, 1] - hi[:, 1]))
+	return np.hypot(dx, dy)
+
+def group_starts(keys):
+	"""升序数组中每组相同值的起始位置"""
+	return np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+
+def expand_children(qi, gi, child_count, fanout):
+	"""把 (查询块, 块) 对展开为 (查询块, 子块) 对，每块有 fanout 个子块"""
+	first = gi * fanout
+	counts = np.minimum(first + fanout, child_count) - first
+	offsets = np.cumsum(counts) - counts
+	child_qi = np.repeat(qi, counts)
+	child_gi = np.arange(counts.sum()) - np.repeat(offsets - first, counts)
+	return child_qi, child_gi
+
+def nearest_neighbors(query, ref):
+	"""每个查询点在 ref 中的最近点下标和距离（双树分支定界）
+
+	query 与 ref 都按连续下标每 NEAREST_FANOUT 个点分为一个叶块；ref 的叶块再逐层
+	合并为每块 NEAREST_FANOUT 个子块的层次结构。以查询块为单位自顶向下剪枝：
+	查询块包围盒到 ref 块首点的最远距离给出该查询块的上界，两个包围盒的间距给出
+	下界，下界超过上界的块直接剪掉。到达叶块后先精确计算每个查询块下界最小的
+	叶块，收紧每个查询点的最近距离，再逐点剔除不可能更近的叶块，其余叶块按
+	NEAREST_FANOUT × NEAREST_FANOUT 的稠密距离矩阵计算。
+
+	查询按块处理，上层剪枝的代价摊到块内每个点上；两条轨迹重合、平行或相距很远
+	时，每个查询块通常只需计算几个叶块。候选对分批展开，内存有上限。
+	"""
+	n, m = len(query), len(ref)
+	size = NEAREST_FANOUT
+	qx, qy, q_lo, q_hi = point_blocks(query, size)
+	rx, ry, r_lo, r_hi = point_blocks(ref, size)
+	# 每层为 (包围盒下角, 上角, 块首点)，从叶块向上合并，直到只剩少数几块
+	levels = [(r_lo, r_hi, np.column_stack((rx[:, 0], ry[:, 0])))]
+	while len(levels[-1][0]) > NEAREST_FANOUT:
+		lo, hi, first = levels[-1]
+		starts = np.arange(0, len(lo), NEAREST_FANOUT)
+		levels.append((np.minimum.reduceat(lo, starts), np.maximum.reduceat(hi, starts), first[starts]))
+	levels.reverse()
+	bound = np.full(len(qx), np.inf)  # 每个查询块内所有点最近距离的上界
+	best = np.full(qx.shape, np.inf)
+	indices = np.zeros(qx.shape, dtype=np.int64)
+
+	def update(qi, gi):
+		"""计算 (查询块, 叶块) 对的稠密距离矩阵，更新块内每个点的最近点
+
+		qi 在各层展开和剪枝后始终保持升序，可以按连续区间求最小值。
+		"""
+		step = max(1, NEAREST_CHUNK_PAIRS // (size * size))
+		for start in range(0, len(qi), step):
+			q, g = qi[start:start + step], gi[start:start + step]
+			dx = qx[q][:, :, None] - rx[g][:, None, :]
+			dy = qy[q][:, :, None] - ry[g][:, None, :]
+			d = dx * dx
+			d += dy * dy
+			nearest = d.argmin(axis=2)
+			pair_min = np.sqrt(np.take_along_axis(d, nearest[:, :, None], axis=2)[:, :, 0])
+			starts = group_starts(q)
+			group_min = np.minimum.reduceat(pair_min, starts, axis=0)
+			owners = q[starts]
+			improved = group_min < best[owners]
+			best[owners] = np.where(improved, group_min, best[owners])
+			hit = pair_min == np.repeat(np.where(improved, group_min, -1.0), np.diff(np.append(starts, len(q))), axis=0)
+			indices[q[:, None].repeat(size, axis=1)[hit], np.nonzero(hit)[1]] = (g[:, None] * size + nearest)[hit]
+
+	def descend(level, qi, gi):
+		lo, hi, first = levels[level]
+		starts = group_starts(qi)
+		np.minimum.at(bound, qi[starts], np.minimum.reduceat(box_reaches(q_lo[qi], q_hi[qi], first[gi]), starts))
+		lower = box_gaps(q_lo[qi], q_hi[qi], lo[gi], hi[gi])
+		keep = lower <= bound[qi]
+		qi, gi, lower = qi[keep], gi[keep], lower[keep]
+		if level + 1 < len(levels):
+			# 分批展开，限制临时数组大小；上界只会变小，先剪掉的块不会再需要
+			child_count = len(levels[level + 1][0])
+			step = max(1, NEAREST_CHUNK_PAIRS // NEAREST_FANOUT)
+			for start in range(0, len(qi), step):
+				descend(level + 1, *expand_children(qi[start:start + step], gi[start:start + step],
+													child_count, NEAREST_FANOUT))
+			return
+		if not len(qi):
+			return
+		# 叶块：先精确计算每个查询块下界最小的叶块，用块内最远的最近距离收紧上界
+		starts = group_starts(qi)
+		group_min = np.repeat(np.minimum.reduceat(lower, starts), np.diff(np.append(starts, len(qi))))
+		candidates = np.flatnonzero(lower == group_min)
+		# 下界相同（通常都为 0）时取包围盒中心最近的叶块
+		q_centers = q_lo[qi[candidates]] + q_hi[qi[candidates]]
+		r_centers = r_lo[gi[candidates]] + r_hi[gi[candidates]]
+		centers = np.hypot(*(q_centers - r_centers).T)
+		starts = group_starts(qi[candidates])
+		closest = centers == np.repeat(np.minimum.reduceat(centers, starts), np.diff(np.append(starts, len(candidates))))
+		candidates = candidates[closest]
+		nearest = candidates[np.unique(qi[candidates], return_index=True)[1]]
+		update(qi[nearest], gi[nearest])
+		bound[qi[nearest]] = np.minimum(bound[qi[nearest]], best[qi[nearest]].max(axis=1))
+		lower[nearest] = np.inf
+		keep = lower <= bound[qi]
+		qi, gi = qi[keep], gi[keep]
+		# 逐点下界：块内没有任何查询点可能被该叶块改进时跳过
+		ddx = np.maximum(np.maximum(r_lo[gi, :1] - qx[qi], qx[qi] - r_hi[gi, :1]), 0.0)
+		ddy = np.maximum(np.maximum(r_lo[gi, 1:] - qy[qi], qy[qi] - r_hi[gi, 1:]), 0.0)
+		useful = (ddx * ddx + ddy * ddy < best[qi] ** 2).any(axis=1)
+		update(qi[useful], gi[useful])
+
+	top = len(levels[0][0])
+	step = max(1, NEAREST_CHUNK_PAIRS // (top * NEAREST_FANOUT))
+	for start in range(0, len(qx), step):
+		chunk = np.arange(start, min(start + step, len(qx)))
+		descend(0, np.repeat(chunk, top), np.tile(np.arange(top), len(chunk)))
+	# 补齐的点映射回 ref 的最后一个点
+	return np.minimum(indices.ravel()[:n], m - 1), best.ravel()[:n]
+
+def divergence_intervals(distances, cumulative, tolerance):
+	"""把超过 tolerance 的连续点合并为偏离区间"""
+	over = np.concatenate(([False], distances > tolerance, [False]))
+	changes = np.flatnonzero(over[1:] != over[:-1])
+	intervals = []
+	for start, end in zip(changes[::2].tolist(), (changes[1::2] - 1).tolist()):
+		intervals.append({
+			'start_index': start,
+			'end_index': end,
+			'start_km': float(cumulative[start]) / 1000,
+			'end_km': float(cumulative[end]) / 1000,
+			'max_distance': float(distances[start:end + 1].max()),
+		})
+	return intervals
+
+class FrechetFreeSpace:
+	"""离散 Fréchet 问题的自由空间：距离不超过上界的稀疏单元
+
+	reachable 把每一行的自由单元压缩为 Python 整数位图，逐行判定可达性只需
+	常数次位运算，与行内单元数无关；bottleneck 在自由空间上做一次最小瓶颈
+	动态规划，直接得到精确值。
+	"""
+	def __init__(self, a, b, epsilon):
+		self.n = len(a)
+		self.m = len(b)
+		# 网格候选点对通常是半径内点对的 1.5~3 倍，候选过多时不必展开
+		pairs = grid_pairs(a, b, epsilon * (1 + 1e-9), 4 * FRECHET_MAX_CELLS, FRECHET_MAX_CELLS)
+		self.too_large = pairs is None
+		if self.too_large:
+			return
+		qi, rj, d = pairs
+		order = np.argsort(qi * self.m + rj)
+		# 下标用 int32 存储，减少大自由空间的内存
+		self.rows, self.cols, self.costs = qi[order].astype(np.int32), rj[order].astype(np.int32), d[order]
+
+	def reachable(self, epsilon):
+		"""是否存在一条所有配对距离都不超过 epsilon 的单调配对"""
+		free = self.costs <= epsilon
+		rows, cols = self.rows[free], self.cols[free]
+		if len(rows) == 0 or rows[0] != 0 or cols[0] != 0:
+			return False
+		# 每一行都必须有自由单元
+		starts = np.flatnonzero(np.concatenate(([True], rows[1:] != rows[:-1])))
+		if len(starts) != self.n:
+			return False
+		lows = cols[starts]
+		ends = np.concatenate((starts[1:], [len(rows)]))
+		widths = cols[ends - 1] - lows + 1
+
+		# 每行位图按字节对齐后打包，行内第 k 位对应列 lows[i] + k
+		row_bytes = (widths + 7) // 8
+		byte_offsets = np.concatenate(([0], np.cumsum(row_bytes)))
+		bit_positions = np.repeat(byte_offsets[:-1] * 8 - lows, np.diff(np.concatenate((starts, [len(rows)])))) + cols
+		bits = np.zeros(int(byte_offsets[-1]) * 8, dtype=np.uint8)
+		bits[bit_positions] = 1
+		packed = np.packbits(bits, bitorder='little').tobytes()
+
+		offsets = byte_offsets.tolist()
+		lows = lows.tolist()
+		reached = 1
+		previous_low = 0
+		for i in range(self.n):
+			mask = int.from_bytes(packed[offsets[i]:offsets[i + 1]], 'little')
+			if i == 0:
+				seeds = mask & 1
+			else:
+				# 从上方 (i-1, j) 或左上方 (i-1, j-1) 进入
+				above = reached | (reached << 1)
+				shift = lows[i] - previous_low
+				above = above >> shift if shift >= 0 else above << -shift
+				seeds = above & mask
+			# 在连续的自由单元内向右扩展：加法进位会一直传播到该段末尾
+			reached = (mask & ~(mask + seeds)) | seeds
+			if not reached:
+				return False
+			previous_low = lows[i]
+		return bool(reached >> (self.m - 1 - previous_low) & 1)
+
+	def bottleneck(self):
+		"""所有单调配对中最大配对距离的最小值，只考虑自由空间内的单元；不可达时为 inf
+
+		逐行求每个自由单元的最小瓶颈值：c(i, j) = max(d(i, j), min(c(i-1, j), c(i-1, j-1), c(i, j-1)))。
+		每个单元只需常数次列表访问，代价与单元数成正比，比在候选距离上反复
+		判定可达性快得多。
+		"""
+		starts = np.searchsorted(self.rows, np.arange(self.n + 1)).tolist()
+		# 用 array 逐个取值，避免把数百万个单元一次性转为 Python 对象
+		cols, costs = array('i', self.cols.tobytes()), array('d', self.costs.tobytes())
+		inf = math.inf
+		# 上一行第 j 列的值存放在 previous[j - previous_low]；虚拟的第 -1 行只允许进入 (0, 0)
+		previous_low, previous = -1, [0.0]
+		for i in range(self.n):
+			start, end = starts[i], starts[i + 1]
+			if start == end:
+				return inf
+			low = cols[start]
+			current = [inf] * (cols[end - 1] - low + 1)
+			shift = low - previous_low
+			width = len(previous)
+			for j, cost in zip(cols[start:end], costs[start:end]):
+				k = j - low
+				best = current[k - 1] if k else inf
+				p = k + shift
+				if 0 <= p < width and previous[p] < best:
+					best = previous[p]
+				if 0 < p <= width and previous[p - 1] < best:
+					best = previous[p - 1]
+				if best < inf:
+					current[k] = cost if cost > best else best
+			if min(current) == inf:
+				return inf
+			previous_low, previous = low, current
+		k = self.m - 1 - previous_low
+		return previous[k] if 0 <= k < len(previous) else inf
+
+def free_space_size(a, b, epsilon):
+	"""抽样估计阈值 epsilon 下的自由空间单元数，候选过多时为 inf"""
+	sample = a[::FRECHET_SAMPLE_STRIDE]
+	scale = len(a) / len(sample)
+	pairs = grid_pairs(sample, b, epsilon * (1 + 1e-9), 4 * FRECHET_MAX_CELLS / scale)
+	return math.inf if pairs is None else len(pairs[0]) * scale
+
+def discrete_frechet(a, b, nearest_ab, lower=0.0):
+	"""离散 Fréchet 距离，只在距离较小的稀疏单元上求解
+
+	先用最近点下标构造一条单调配对得到上界 U；lower 是已知下界（如 Hausdorff
+	距离），首尾两点必然互相配对，其距离也是下界。自由空间的单元数随阈值增长，
+	因此不直接在 U 上建立，而是在 [lower, U] 间按 FRECHET_PROBES 取阈值，抽样
+	估计各阈值下的单元数：每次取估计单元数不超过当前阈值两倍的最大阈值建立自由
+	空间，失败的尝试总代价不超过最后一次。可达时在该自由空间上做一次最小瓶颈
+	动态规划得到精确值。重合度高的轨迹结果通常接近 lower，只需很小的自由空间。
+
+	返回 (上界, 下界, 是否精确)。需要的自由空间超过 FRECHET_MAX_CELLS 个单元时
+	停止，返回已知的上下界。
+	"""
+	m = len(b)
+	# 单调化的最近点下标即一条合法配对：第 i 行覆盖 b 的 [j(i-1), j(i)]
+	j = np.maximum.accumulate(nearest_ab)
+	j[0] = 0
+	j[-1] = m - 1
+	j = np.maximum.accumulate(j)
+	row_start = np.concatenate(([0], j[:-1]))
+	lengths = j - row_start + 1
+	rows = np.repeat(np.arange(len(a)), lengths)
+	cols = np.repeat(row_start, lengths) + np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+	upper = float(np.hypot(*(a[rows] - b[cols]).T).max())
+	lower = max(lower, float(np.hypot(*(a[0] - b[0]))), float(np.hypot(*(a[-1] - b[-1]))))
+	# 上界已达到下界时无需再求解
+	if upper <= lower:
+		return upper, upper, True
+
+	probes = [lower + (upper - lower) * fraction for fraction in FRECHET_PROBES]
+	sizes = [free_space_size(a, b, probe) for probe in probes]
+	known_lower = lower
+	k = 0
+	while k < len(probes):
+		# 估计值只用于挑选阈值；实际单元数仍由 FrechetFreeSpace 按上限检查
+		k = max(i for i in range(k, len(probes)) if i == k or sizes[i] <= min(2 * sizes[k], FRECHET_MAX_CELLS))
+		space = FrechetFreeSpace(a, b, probes[k])
+		if space.too_large:
+			return upper, known_lower, False
+		if space.reachable(probes[k]):
+			frechet = space.bottleneck()
+			return frechet, frechet, True
+		known_lower = probes[k]
+		# 先释放当前自由空间，再建立更大的一个
+		space = None
+		k += 1
+	return upper, known_lower, False
+
+def compare_segments(first, second, tolerance=COMPARE_TOLERANCE):
+	"""比较两条轨迹：Hausdorff 距离、离散 Fréchet 距离和偏离区间（按双方版本缓存）"""
+	def compute():
+		lat_a, lon_a, _ = segment_arrays(first)
+		lat_b, lon_b, _ = segment_arrays(second)
+		lat0 = (lat_a.mean() + lat_b.mean()) / 2
+		a = project_points(lat_a, lon_a, lat0)
+		b = project_points(lat_b, lon_b, lat0)
+		nearest_ab, dist_ab = nearest_neighbors(a, b)
+		_, dist_ba = nearest_neighbors(b, a)
+		hausdorff = float(max(dist_ab.max(), dist_ba.max()))
+		# Hausdorff 距离是 Fréchet 距离的下界
+		frechet, frechet_lower, exact = discrete_frechet(a, b, nearest_ab, hausdorff)
+		return {
+			'hausdorff': hausdorff,
+			'frechet': frechet,
+			'frechet_lower': frechet_lower,
+			'frechet_exact': exact,
+			'intervals_first': divergence_intervals(dist_ab, cumulative_distances(first), tolerance),
+			'intervals_second': divergence_intervals(dist_ba, cumulative_distances(second), tolerance),
+		}
+	# 以 id 作键、用弱引用核对身份：缓存不会让已删除的 second 继续驻留，id 被复用时也不会误用；
+	# second 修改后的结果覆盖同一项，不为每个版本各留一份
+	key = ('compare', id(second), tolerance)
+	entry = first._cache.get(key)
+	if entry is not None and entry[0] == first.version:
+		reference, version, result = entry[1]
+		if reference() is second and version == second.version:
+			return result
+	result = compute()
+	first._cache[key] = (first.version, (weakref.ref(second), second.version, result))
+	return result
+
+def render_segment_comparison(segments):
+	"""轨迹对比面板：选择两条轨迹并显示相似度"""
+	st.write("轨迹对比：")
+	# 名称可能重复，选项前加上序号
+	labels = [f"{segment.order + 1}. {segment.name}" for segment in segments]
+	cc1, cc2 = st.columns(2)
+	first_order = labels.index(cc1.selectbox("轨迹1", labels, key="compare_first"))
+	second_order = labels.index(cc2.selectbox("轨迹2", labels, index=min(1, len(segments) - 1), key="compare_second"))
+	if first_order == second_order or not st.button("对比", key="compare_button"):
+		return
+	first = st.session_state.segment_mgr.get_segment_by_order(first_order)
+	second = st.session_state.segment_mgr.get_segment_by_order(second_order)
+	result = compare_segments(first, second)
+	st.write(f"Hausdorff 距离：{result['hausdorff']:.1f}m")
+	if result['frechet_exact']:
+		st.write(f"离散 Fréchet 距离：{result['frechet']:.1f}m")
+	elif f"{result['frechet_lower']:.1f}" == f"{result['frechet']:.1f}":
+		st.write(f"离散 Fréchet 距离：约 {result['frechet']:.1f}m（上下界相差不到 0.1m）")
+	else:
+		st.write(f"离散 Fréchet 距离：{result['frechet_lower']:.1f}m ~ {result['frechet']:.1f}m"
+				 f"（候选单元超过 {FRECHET_MAX_CELLS:,} 个，只给出上下界）")
+	for segment, intervals in ((first, result['intervals_first']), (second, result['intervals_second'])):
+		if intervals:
+			st.write(f"{segment.name} 偏离区间（超过 {COMPARE_TOLERANCE:.0f}m）：")
+			st.table([{
+				"起点": f"{interval['start_km']:.2f}km",
+				"终点": f"{interval['end_km']:.2f}km",
+				"点序号": f"{interval['start_index'] + 1}-{interval['end_index'] + 1}",
+				"最大偏离": f"{interval['max_distance']:.1f}m"
+			} for interval in intervals])
+		else:
+			st.write(f"{segment.name} 无偏离区间")
+
+# 内存统计参数
+SESSION_MEMORY_LIMIT = int(os.environ.get('KML_EDITOR_SESSION_MEMORY_MB', '512')) * 1024 * 1024  # 单个会话内存上限
+SESSION_REGISTRY_TTL = 3600  # 超过该时间（秒）未更新的会话不再计入进程统计
+FLOAT_BYTES = sys.getsizeof(0.0)
+POINT_BYTES = sys.getsizeof([0.0, 0.0]) + 2 * FLOAT_BYTES  # 每个 [lat, lon] 点的内存
+
+def value_nbytes(value):
+	"""估算缓存值中 numpy 数组和字符串占用的字节数"""
+	if isinstance(value, np.ndarray):
+		return value.nbytes
+	if isinstance(value, str):
+		return sys.getsizeof(value)
+	if isinstance(value, dict):
+		return sum(value_nbytes(v) for v in value.values())
+	if isinstance(value, (list, tuple)):
+		return sum(value_nbytes(v) for v in value)
+	return 0
+
+def segment_memory(segment):
+	"""轨迹段的内存占用估算（字节）：原始轨迹点和派生数据缓存"""
+	if segment.compressed:
+		points = sys.getsizeof(segment._packed)
+	else:
+		points = (sys.getsizeof(segment.coordinates) + len(segment.coordinates) * POINT_BYTES
+				  + sys.getsizeof(segment.elevations) + len(segment.elevations) * FLOAT_BYTES)
+	cache = sum(value_nbytes(value) for _, value in segment._cache.values())
+	return {'points': points, 'cache': cache, 'total': points + cache}
+
+def session_memory():
+	"""当前会话的内存占用估算（字节），包含每个轨迹段的明细
+
+	明细按段列表排列（段名可能重复，不能作为键），每项附带 order 和 name。
+	"""
+	segments = [dict(segment_memory(segment), order=segment.order, name=segment.name)
+				for segment in st.session_state.get('segments', [])]
+	return {
+		'segments': segments,
+		'points': sum(usage['points'] for usage in segments),
+		'cache': sum(usage['cache'] for usage in segments),
+		'total': sum(usage['total'] for usage in segments),
+	}
+
+@st.cache_resource
+def session_registry():
+	"""进程内所有会话最近一次上报的内存占用，跨会话共享"""
+	return {'lock': threading.Lock(), 'sessions': {}}
+
+def current_session_id():
+	"""当前 Streamlit 会话的 ID，无运行上下文时返回 None"""
+	from streamlit.runtime.scriptrunner import get_script_run_ctx
+	ctx = get_script_run_ctx()
+	return ctx.session_id if ctx is not None else None
+
+def report_session_memory(total):
+	"""上报当前会话的内存占用，并清理过期会话"""
+	registry = session_registry()
+	now = time.time()
+	with registry['lock']:
+		sessions = registry['sessions']
+		session_id = current_session_id()
+		if session_id is not None:
+			sessions[session_id] = (total, now)
+		for stale in [sid for sid, (_, updated) in sessions.items() if now - updated > SESSION_REGISTRY_TTL]:
+			del sessions[stale]
+
+def process_memory():
+	"""进程级内存统计：各会话上报的总和以及进程 RSS（字节）"""
+	registry = session_registry()
+	with registry['lock']:
+		sessions = {sid: total for sid, (total, _) in registry['sessions'].items()}
+	rss = None
+	try:
+		with open('/proc/self/statm') as f:
+			rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+	except (OSError, ValueError):
+		pass
+	return {'sessions': sessions, 'total': sum(sessions.values()), 'rss': rss}
+
+def enforce_memory_limit():
+	"""超出会话内存上限时先释放冷缓存（未选中段优先），返回最终占用"""
+	usage = session_memory()
+	if usage['total'] > SESSION_MEMORY_LIMIT:
+		segments = sorted(st.session_state.segments, key=lambda s: s.selected)
+		for segment in segments:
+			if usage['total'] <= SESSION_MEMORY_LIMIT:
+				break
+			freed = segment_memory(segment)['cache']
+			if freed:
+				segment.clear_cache()
+				usage['total'] -= freed
+				logger.info("会话 %s 释放 %s 的缓存 %d 字节", current_session_id(), segment.name, freed)
+		usage = session_memory()
+		if usage['total'] > SESSION_MEMORY_LIMIT:
+			logger.warning("会话 %s 内存占用 %d 字节，超出上限 %d 字节",
+						   current_session_id(), usage['total'], SESSION_MEMORY_LIMIT)
+	report_session_memory(usage['total'])
+	return usage
+
+def check_memory_room(points, needed=None):
+	"""新增 points 个轨迹点（约 needed 字节）后是否仍在会话内存上限内，超出时显示错误"""
+	if needed is None:
+		needed = points * (POINT_BYTES + FLOAT_BYTES)
+	total = session_memory()['total']
+	if total + needed <= SESSION_MEMORY_LIMIT:
+		return True
+	st.error(f"会话内存不足：已用 {total / 1024 / 1024:.1f}MB，新增约需 {needed / 1024 / 1024:.1f}MB，"
+			 f"上限 {SESSION_MEMORY_LIMIT / 1024 / 1024:.0f}MB。请删除部分轨迹段后重试")
+	logger.warning("会话 %s 拒绝新增 %d 个轨迹点：已用 %d 字节，上限 %d 字节",
+				   current_session_id(), points, total, SESSION_MEMORY_LIMIT)
+	return False
+
+def render_memory_panel(usage):
+	"""侧边栏调试面板：显示会话和进程的内存占用"""
+	mb = 1024 * 1024
+	with st.sidebar.expander("内存占用"):
+		process = process_memory()
+		st.write(f"本会话：{usage['total'] / mb:.1f}MB / {SESSION_MEMORY_LIMIT / mb:.0f}MB"
+				 f"（轨迹点 {usage['points'] / mb:.1f}MB，缓存 {usage['cache'] / mb:.1f}MB）")
+		st.write(f"全部会话：{process['total'] / mb:.1f}MB（{len(process['sessions'])} 个会话）")
+		if process['rss'] is not None:
+			st.write(f"进程 RSS：{process['rss'] / mb:.1f}MB")
+		if usage['segments']:
+			st.table([{
+				"轨迹段": f"{segment_usage['order'] + 1}. {segment_usage['name']}",
+				"轨迹点": f"{segment_usage['points'] / mb:.2f}MB",
+				"缓存": f"{segment_usage['cache'] / mb:.2f}MB"
+			} for segment_usage in usage['segments']])
+
+SIMPLIFY_MIN_TOLERANCE = 0.01  # 偏差不超过该值（米）的区间不再细分
+SIMPLIFY_DEPTH_FACTOR = 2      # 超过该倍数的 log2(n) 层后改为中点分割，限制最坏情况的层数
+EXPORT_DEFAULT_BUDGET = 10000  # 导出点数上限的默认值
+
+def chord_distances(x, y, starts, ends, idx, owner):
+	"""点 idx 到所属区间弦 starts[owner]-ends[owner] 的线段距离（米），x、y 为平面坐标"""
+	ax, ay = x[starts][owner], y[starts][owner]
+	abx, aby = x[ends][owner] - ax, y[ends][owner] - ay
+	apx, apy = x[idx] - ax, y[idx] - ay
+	length = abx * abx + aby * aby
+	t = np.divide(apx * abx + apy * aby, length, out=np.zeros_like(length), where=length > 0)
+	np.clip(t, 0.0, 1.0, out=t)
+	return np.hypot(apx - t * abx, apy - t * aby)
+
+def simplification_weights(x, y, forced, keep):
+	"""逐层向量化的 Douglas-Peucker，返回每个点的有效偏差（米）
+
+	点的有效偏差为它被选为分割点时到弦的距离与父区间有效偏差中的较小值，沿层级单调
+	不增，因此保留有效偏差大于 ε 的点即等价于容差为 ε 的 Douglas-Peucker。forced
+	（升序，含首尾）为强制保留点，值为 inf。每层对所有区间一起计算，代价 O(n)；
+	区间的有效偏差小于当前第 keep 大的值或不超过 SIMPLIFY_MIN_TOLERANCE 时不再细分，
+	其内部点不会进入前 keep 名，值保持为 0。
+
+	Douglas-Peucker 的层数没有 O(log n) 的保证：平滑的多圈螺旋线每次都在区间一端附近
+	分割，层数可达数百。因此超过 SIMPLIFY_DEPTH_FACTOR·log2(n) 层后改为在区间中点
+	分割，再多至多 log2(n) 层即结束，总代价 O(n log n)。中点的值同样取区间有效偏差，
+	所以保留值大于 ε 的点仍保证偏差不超过 ε，只是点数可能略多于纯 Douglas-Peucker。
+	"""
+	weights = np.zeros(len(x))
+	weights[forced] = np.inf
+	if keep <= 0:
+		return weights
+	starts, ends = forced[:-1], forced[1:]
+	parents = np.full(len(starts), np.inf)
+	found = np.empty(0)
+	cutoff = 0.0
+	balanced_depth = SIMPLIFY_DEPTH_FACTOR * max(1, math.ceil(math.log2(max(len(x), 2))))
+	depth = 0
+	while len(starts):
+		lengths = ends - starts - 1
+		active = lengths > 0
+		starts, ends, parents, lengths = starts[active], ends[active], parents[active], lengths[active]
+		if not len(starts):
+			break
+		# 展开所有区间的内部点
+		offsets = np.cumsum(lengths) - lengths
+		owner = np.repeat(np.arange(len(starts)), lengths)
+		idx = np.arange(lengths.sum()) - offsets[owner] + starts[owner] + 1
+		dist = chord_distances(x, y, starts, ends, idx, owner)
+		group_max = np.maximum.reduceat(dist, offsets)
+		if depth < balanced_depth:
+			# 每个区间第一个最远点作为分割点
+			hits = np.flatnonzero(dist == group_max[owner])
+			splits = idx[hits[np.unique(owner[hits], return_index=True)[1]]]
+		else:
+			splits = (starts + ends) // 2
+		values = np.minimum(group_max, parents)
+		depth += 1
+		weights[splits] = values
+
+		found = np.concatenate((found, values))
+		if len(found) > keep:
+			found = np.partition(found, len(found) - keep)[len(found) - keep:]
+			cutoff = max(cutoff, float(found[0]))
+		# 与第 keep 大的值相等的区间仍需细分，其子区间可能同值
+		go = (values > SIMPLIFY_MIN_TOLERANCE) & (values >= cutoff)
+		starts, splits, ends, values = starts[go], splits[go], ends[go], values[go]
+		starts, ends = np.concatenate((starts, splits)), np.concatenate((splits, ends))
+		parents = np.concatenate((values, values))
+	return weights
+
+def simplification_deviation(x, y, kept):
+	"""按保留点下标 kept（升序）连线后，被删除点到所在线段的最大距离（米）"""
+	if len(kept) < 2:
+		return 0.0
+	idx = np.arange(kept[0], kept[-1] + 1)
+	owner = np.clip(np.searchsorted(kept, idx, side='right') - 1, 0, len(kept) - 2)
+	return float(chord_distances(x, y, kept[:-1], kept[1:], idx, owner).max())
+
+def segment_simplification_input(segment):
+	"""简化所需的平面坐标 x、y（米）和强制保留点：首尾（分割边界）与最高、最低海拔点"""
+	lat, lon, ele = segment_arrays(segment)
+	points = project_points(lat, lon, float(lat.mean()))
+	forced = np.unique([0, len(lat) - 1, int(ele.argmax()), int(ele.argmin())])
+	return points[:, 0].copy(), points[:, 1].copy(), forced
+
+def select_by_weights(weights, budget):
+	"""在 budget 个点以内保留有效偏差最大的点，返回被保留点的布尔掩码"""
+	if budget >= len(weights):
+		return np.ones(len(weights), dtype=bool)
+	forced = np.isinf(weights)
+	keep = budget - int(forced.sum())
+	if keep <= 0:
+		return forced
+	# 取严格大于第 keep+1 大的值，同值的点一起保留或一起舍弃，保证结果与 Douglas-Peucker 一致
+	threshold = np.partition(weights[~forced], -(keep + 1))[-(keep + 1)]
+	return weights > threshold
+
+def simplify_segment(segment, budget):
+	"""按单段点数上限简化，返回 (保留点下标, 最大偏差米)（按版本缓存）"""
+	def compute():
+		x, y, forced = segment_simplification_input(segment)
+		weights = simplification_weights(x, y, forced, max(budget - len(forced), 0))
+		kept = np.flatnonzero(select_by_weights(weights, budget))
+		return kept, simplification_deviation(x, y, kept)
+	return segment.get_cached(('simplify', budget), compute)
+
+def simplify_to_budget(segments, segment_budget=None, total_budget=None):
+	"""按每段或总点数上限简化轨迹段，返回 {id(segment): (保留点下标, 最大偏差米)}
+
+	总点数上限在所有段之间共用一个容差，使最大偏差尽量小；各段的首尾点和海拔极值点
+	始终保留，因此上限低于这些点数时结果会超出上限。
+	"""
+	if segment_budget is not None:
+		return {id(segment): simplify_segment(segment, segment_budget) for segment in segments}
+
+	inputs = [segment_simplification_input(segment) for segment in segments]
+	counts = np.array([len(x) for x, _, _ in inputs])
+	offsets = np.cumsum(counts) - counts
+	# 各段首尾都是强制点，拼接后区间不会跨段
+	x = np.concatenate([x for x, _, _ in inputs])
+	y = np.concatenate([y for _, y, _ in inputs])
+	forced = np.concatenate([segment_forced + offset for (_, _, segment_forced), offset in zip(inputs, offsets)])
+	weights = simplification_weights(x, y, forced, max(total_budget - len(forced), 0))
+	mask = select_by_weights(weights, total_budget)
+	result = {}
+	for segment, (segment_x, segment_y, _), offset, count in zip(segments, inputs, offsets, counts):
+		kept = np.flatnonzero(mask[offset:offset + count])
+		result[id(segment)] = (kept, simplification_deviation(segment_x, segment_y, kept))
+	return result
+
+EXPORT_WORKERS = int(os.environ.get('KML_EDITOR_EXPORT_WORKERS', str(min(4, os.cpu_count() or 1))))  # 导出工作进程数
+EXPORT_PARALLEL_MIN_POINTS = 20000  # 待渲染的轨迹点少于该值时直接在当前线程渲染
+
+KML_HEADER = """<?xml version="1.0" encoding="UTF-8"?>
 <kml xmlns="http://www.opengis.net/kml/2.2"
 	xmlns:gx="http://www.google.com/kml/ext/2.2">
 	<Document>
-		<name>导出的轨迹</name>
+		<name>{name}</name>
 		<Style id="TbuluTrackStyle">
 			<LineStyle>
 				<color>ff0000ff</color>
@@ -334,74 +1678,242 @@ def export_to_kml(segments):
 		<Folder id="TbuluTrackFolder">
 			<name>轨迹</name>
 """
-	
-	# 添加每个轨迹段
-	for segment in sorted(segments, key=lambda x: x.order):
-		# 计算统计信息
-		total_distance = sum(calculate_distance(segment.coordinates[i], segment.coordinates[i+1])
-						   for i in range(len(segment.coordinates)-1))
-		max_elevation = max(segment.elevations)
-		min_elevation = min(segment.elevations)
-		
-		# 计算累计爬升和下降
-		elevation_changes = [segment.elevations[i+1] - segment.elevations[i] 
-						   for i in range(len(segment.elevations)-1)]
-		total_ascent = sum(change for change in elevation_changes if change > 0)
-		total_descent = abs(sum(change for change in elevation_changes if change < 0))
-		
-		kml_str += f"""			<Placemark>
-				<name><![CDATA[{segment.name}]]></name>
-				<description><![CDATA[
-					<div>通过"KML轨迹编辑器"生成</div>
-					<div>轨迹点数:{len(segment.coordinates)}</div>
-					<div>本段里程:{total_distance:.2f}米</div>
-					<div>最高海拔:{max_elevation:.2f}米</div>
-					<div>最低海拔:{min_elevation:.2f}米</div>
-					<div>累计爬升:{total_ascent:.2f}米</div>
-					<div>累计下降:{total_descent:.2f}米</div>
-				]]></description>
-				<styleUrl>#TbuluTrackStyle</styleUrl>
-				<gx:Track>
-"""
-		
-		# 添加坐标点
-		for coord, elev in zip(segment.coordinates, segment.elevations):
-			lat, lon = coord
-			kml_str += f"					<gx:coord>{lon} {lat} {elev}</gx:coord>\n"
-		
-		kml_str += """				</gx:Track>
-			</Placemark>
-"""
-	
-	# 关闭KML文档
-	kml_str += """		</Folder>
+
+KML_FOOTER = """		</Folder>
 	</Document>
 </kml>"""
-	
-	return kml_str
+
+@st.cache_resource
+def export_pool():
+	"""进程内共享的导出工作进程池
+
+	渲染坐标是纯 Python 字符串操作，线程受 GIL 限制无法并行，因此使用进程；
+	spawn 方式不会复制 Streamlit 服务器线程持有的锁。
+	"""
+	return ProcessPoolExecutor(max_workers=EXPORT_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+
+def placemark_job(segment, kept=None):
+	"""渲染一个轨迹段 Placemark 所需的参数，kept 为简化后保留点的下标"""
+	lat, lon, elevations = segment.point_arrays()
+	metrics = segment_metrics(segment)
+	if kept is not None:
+		# 里程和爬升仍按原始轨迹统计；海拔极值点在简化时保留
+		lat, lon, elevations = lat[kept], lon[kept], elevations[kept]
+	stats = {
+		'points': len(lat),
+		'distance': metrics['distance'],
+		'max_elevation': float(elevations.max()),
+		'min_elevation': float(elevations.min()),
+		'ascent': metrics['ascent'],
+		'descent': metrics['descent'],
+	}
+	return segment.name, stats, lat, lon, elevations
+
+def placemark_fragments(segments, simplified=None):
+	"""按段返回 Placemark 片段
+
+	片段按轨迹段版本号和名称缓存（重命名不改变版本号，但片段中包含名称），未修改的段
+	直接复用；过期的片段在工作进程池中并行重新渲染。冷数据压缩时片段随缓存一起
+	释放（见 Segment.compress）。
+	simplified 为 simplify_to_budget 的结果时按简化后的点渲染，不使用缓存。
+	"""
+	fragments = {}
+	stale = []
+	for segment in segments:
+		entry = segment._cache.get('kml')
+		if simplified is None and entry is not None and entry[0] == segment.version and entry[1][0] == segment.name:
+			fragments[id(segment)] = entry[1][1]
+		else:
+			stale.append(segment)
+
+	jobs = [(segment, segment.version, placemark_job(segment, simplified[id(segment)][0] if simplified else None))
+			for segment in stale]
+	rendered = None
+	if len(jobs) > 1 and EXPORT_WORKERS > 1 and sum(len(job[2][2]) for job in jobs) >= EXPORT_PARALLEL_MIN_POINTS:
+		try:
+			futures = [export_pool().submit(render_placemark, *job) for _, _, job in jobs]
+			rendered = [future.result() for future in futures]
+		except BrokenProcessPool:
+			logger.warning("导出进程池不可用，改为在当前线程渲染")
+			export_pool.clear()
+	if rendered is None:
+		rendered = [render_placemark(*job) for _, _, job in jobs]
+
+	for (segment, version, _), fragment in zip(jobs, rendered):
+		if simplified is None:
+			segment._cache['kml'] = (version, (segment.name, fragment))
+		fragments[id(segment)] = fragment
+	return [fragments[id(segment)] for segment in segments]
+
+def export_to_kml(segments, simplified=None):
+	"""将所有轨迹段导出为KML格式，simplified 见 placemark_fragments"""
+	segments = sorted(segments, key=lambda x: x.order)
+	return KML_HEADER.format(name="导出的轨迹") + "".join(placemark_fragments(segments, simplified)) + KML_FOOTER
+
+def export_to_kmz(segments, simplified=None):
+	"""将每个轨迹段导出为 KMZ 中的单独 KML 文件，doc.kml 通过 NetworkLink 引用各段"""
+	segments = sorted(segments, key=lambda x: x.order)
+	fragments = placemark_fragments(segments, simplified)
+	paths = [f"segments/{i + 1:03d}.kml" for i in range(len(segments))]
+	links = "".join(f"""			<NetworkLink>
+				<name><![CDATA[{segment.name}]]></name>
+				<Link><href>{path}</href></Link>
+			</NetworkLink>
+""" for segment, path in zip(segments, paths))
+
+	buffer = BytesIO()
+	with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as kmz:
+		# doc.kml 须为第一个文件
+		kmz.writestr('doc.kml', KML_HEADER.format(name="导出的轨迹") + links + KML_FOOTER)
+		for segment, path, fragment in zip(segments, paths, fragments):
+			kmz.writestr(path, KML_HEADER.format(name=segment.name) + fragment + KML_FOOTER)
+	return buffer.getvalue()
+
+SEGMENT_PAGE_SIZES = [10, 20, 50, 100]
+
+PARQUET_METADATA_KEY = b'kml_editor'
+
+def export_to_parquet(segments):
+	"""将所有轨迹段导出为一张 Parquet 列式表
+
+	每行一个轨迹点，列为 segment_id、order、point_index、name、lat、lon、
+	elevation；每段的汇总统计以 JSON 写入 schema 元数据，键为 segment_id。
+	"""
+	segments = sorted(segments, key=lambda x: x.order)
+	arrays = [segment.point_arrays() for segment in segments]
+	counts = np.array([len(lat) for lat, _, _ in arrays], dtype=np.int64)
+	segment_ids = np.repeat(np.arange(len(segments), dtype=np.int32), counts)
+	point_index = (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)).astype(np.int32)
+	table = pa.table({
+		'segment_id': segment_ids,
+		'order': np.repeat(np.array([segment.order for segment in segments], dtype=np.int32), counts),
+		'point_index': point_index,
+		'name': pa.DictionaryArray.from_arrays(segment_ids, [segment.name for segment in segments]),
+		'lat': np.concatenate([lat for lat, _, _ in arrays]) if arrays else np.empty(0),
+		'lon': np.concatenate([lon for _, lon, _ in arrays]) if arrays else np.empty(0),
+		'elevation': np.concatenate([ele for _, _, ele in arrays]) if arrays else np.empty(0),
+	})
+
+	# 每段的汇总统计
+	summaries = []
+	for segment_id, (segment, (_, _, elevations)) in enumerate(zip(segments, arrays)):
+		metrics = segment_metrics(segment)
+		summaries.append({
+			'segment_id': segment_id,
+			'name': segment.name,
+			'order': segment.order,
+			'split_point_index': segment.split_point_index,
+			'points': metrics['points'],
+			'distance': metrics['distance'],
+			'ascent': metrics['ascent'],
+			'descent': metrics['descent'],
+			'max_elevation': float(elevations.max()) if len(elevations) else None,
+			'min_elevation': float(elevations.min()) if len(elevations) else None,
+		})
+	table = table.replace_schema_metadata({PARQUET_METADATA_KEY: json.dumps(summaries, ensure_ascii=False)})
+
+	buffer = BytesIO()
+	pq.write_table(table, buffer, compression='zstd')
+	return buffer.getvalue()
+
+def parse_parquet(file):
+	"""读取 Parquet 列式轨迹表，返回压缩状态的轨迹段列表
+
+	必需列为 segment_id、lat、lon，可选列为 elevation、order、point_index、name；
+	由外部流水线生成、没有元数据的表也可以导入。
+	"""
+	table = pq.read_table(BytesIO(file.getvalue()))
+	columns = set(table.column_names)
+	missing = {'segment_id', 'lat', 'lon'} - columns
+	if missing:
+		st.error(f"Parquet文件缺少列：{', '.join(sorted(missing))}")
+		return []
+
+	segment_ids = table['segment_id'].to_numpy()
+	sort_keys = [segment_ids]
+	if 'point_index' in columns:
+		sort_keys.insert(0, table['point_index'].to_numpy())
+	order = np.lexsort(sort_keys)
+	segment_ids = segment_ids[order]
+	lat = table['lat'].to_numpy()[order]
+	lon = table['lon'].to_numpy()[order]
+	elevations = table['elevation'].to_numpy()[order] if 'elevation' in columns else np.zeros(len(lat))
+
+	# 每段的起止位置
+	starts = np.flatnonzero(np.concatenate(([True], segment_ids[1:] != segment_ids[:-1]))) if len(segment_ids) else np.empty(0, dtype=np.int64)
+	ends = np.concatenate((starts[1:], [len(segment_ids)]))
+	first_rows = order[starts]
+	names = (table['name'].take(first_rows).to_pylist() if 'name' in columns
+			 else [f"Segment {segment_id}" for segment_id in segment_ids[starts].tolist()])
+	orders = table['order'].take(first_rows).to_numpy() if 'order' in columns else np.arange(len(starts))
+
+	metadata = table.schema.metadata or {}
+	summaries = {summary['segment_id']: summary for summary in json.loads(metadata.get(PARQUET_METADATA_KEY, b'[]'))}
+
+	segments = []
+	for segment_id, name, segment_order, start, end in zip(segment_ids[starts].tolist(), names, orders.tolist(), starts, ends):
+		segment = Segment.from_arrays(name, lat[start:end], lon[start:end], elevations[start:end], segment_order)
+		summary = summaries.get(segment_id)
+		if summary is not None and 0 <= summary['split_point_index'] < end - start:
+			segment.split_point_index = summary['split_point_index']
+		segments.append(segment)
+	return sorted(segments, key=lambda x: x.order)
 
 def render_segment_list():
+	"""分页显示轨迹段列表，只为当前页创建控件"""
 	# 获取最新的轨迹段列表
 	segments = st.session_state.segments
 	
-	# 显示轨迹段列表
-	for i, segment in enumerate(segments):
+	# 筛选条件
+	fc1, fc2, fc3, fc4 = st.columns([3, 2, 2, 2])
+	name_filter = fc1.text_input("按名称筛选", key="segment_filter_name")
+	selection_filter = fc2.selectbox("选中状态", ["全部", "已选中", "未选中"], key="segment_filter_selection")
+	min_length = fc3.number_input("最短长度(km)", min_value=0.0, value=0.0, step=0.5, key="segment_filter_length")
+	page_size = fc4.selectbox("每页段数", SEGMENT_PAGE_SIZES, key="segment_page_size")
+	
+	visible = segments
+	if name_filter:
+		keyword = name_filter.lower()
+		visible = [s for s in visible if keyword in s.name.lower()]
+	if selection_filter != "全部":
+		want_selected = selection_filter == "已选中"
+		visible = [s for s in visible if s.selected == want_selected]
+	if min_length > 0:
+		visible = [s for s in visible if segment_metrics(s)['distance'] >= min_length * 1000]
+	
+	# 分页
+	page_count = max(1, math.ceil(len(visible) / page_size))
+	# 筛选或删除后页数变少时，把超出范围的页码拉回最后一页
+	if st.session_state.get("segment_page", 1) > page_count:
+		st.session_state.segment_page = page_count
+	if page_count > 1:
+		page = st.number_input(f"页码（共 {page_count} 页，{len(visible)} 段）", min_value=1,
+							   max_value=page_count, value=1, key="segment_page")
+		page = min(page, page_count)
+	else:
+		page = 1
+	page_segments = visible[(page - 1) * page_size:page * page_size]
+	
+	# 显示当前页的轨迹段
+	for segment in page_segments:
 		col1, col2, col3 = st.columns([1, 8, 1])
 		
 		# 上移按钮
-		if i > 0 and col1.button("⬆️", key=f"up_{segment.order}"):
+		if segment.order > 0 and col1.button("⬆️", key=f"up_{segment.order}"):
 			st.session_state.segment_mgr.move_segment(segment.order, segment.order - 1)
 			st.experimental_rerun()
 		
-		# 复选框和名称
+		# 复选框和名称（附带缓存的统计信息）
+		metrics = segment_metrics(segment)
 		selected = col2.checkbox(
-			segment.name,
+			f"{segment.name}（{metrics['points']}点，{metrics['distance']/1000:.2f}km，"
+			f"↑{metrics['ascent']:.0f}m ↓{metrics['descent']:.0f}m）",
 			value=segment.selected,
 			key=f"segment_{segment.order}"
 		)
 		
 		# 下移按钮
-		if i < len(segments) - 1 and col3.button("⬇️", key=f"down_{segment.order}"):
+		if segment.order < len(segments) - 1 and col3.button("⬇️", key=f"down_{segment.order}"):
 			st.session_state.segment_mgr.move_segment(segment.order, segment.order + 1)
 			st.experimental_rerun()
 		
@@ -460,11 +1972,23 @@ def main():
 		st.session_state.has_uploaded = False
 	
 	if not st.session_state.has_uploaded:
-		uploaded_file = st.file_uploader("选择KML/KMZ文件", type=['kml', 'kmz'])
-		if uploaded_file:
+		uploaded_file = st.file_uploader("选择KML/KMZ/GPX/GeoJSON/FIT/Parquet文件",
+										 type=[extension.lstrip('.') for extension in TRACK_IMPORTERS] + ['parquet'])
+		if uploaded_file and uploaded_file.name.lower().endswith('.parquet'):
 			try:
-				coordinates, elevations = parse_kml(uploaded_file)
-				if coordinates and elevations:
+				imported = parse_parquet(uploaded_file)
+				if imported and check_memory_room(sum(s.point_count for s in imported),
+												  sum(segment_memory(s)['total'] for s in imported)):
+					st.session_state.segment_mgr.add_imported_segments(uploaded_file.name, imported)
+					st.session_state.has_uploaded = True
+					st.experimental_rerun()
+			except Exception as e:
+				st.error(f"处理文件时出错：{str(e)}")
+		elif uploaded_file:
+			try:
+				points = import_track(uploaded_file)
+				if len(points) and check_memory_room(len(points)):
+					coordinates, elevations = points.to_lists()
 					st.session_state.segment_mgr.add_segment(uploaded_file.name, coordinates, elevations)
 					st.session_state.has_uploaded = True
 					st.experimental_rerun()
@@ -476,20 +2000,22 @@ def main():
 			st.session_state.has_uploaded = False
 			st.experimental_rerun()
 
-	# 获取所有轨迹段
+	# 压缩未选中的轨迹段，并获取所有轨迹段
+	st.session_state.segment_mgr.compress_cold_segments()
 	segments = st.session_state.segment_mgr.get_segments()
 	
+	# 内存统计：超限时释放冷缓存，并在侧边栏显示
+	render_memory_panel(enforce_memory_limit())
+	
 	if len(segments) > 0:
 		# 显示轨迹段列表
 		render_segment_list()
 		
 		# 计算地图中心点（仅在没有保存的中心点时）
 		if st.session_state.map_center is None:
-			all_coords = []
-			for segment in segments:
-				all_coords.extend(segment.coordinates)
-			center_lat = sum(coord[0] for coord in all_coords) / len(all_coords)
-			center_lon = sum(coord[1] for coord in all_coords) / len(all_coords)
+			arrays = [segment.point_arrays() for segment in segments]
+			center_lat = float(np.concatenate([lat for lat, _, _ in arrays]).mean())
+			center_lon = float(np.concatenate([lon for _, lon, _ in arrays]).mean())
 			st.session_state.map_center = [center_lat, center_lon]
 		
 		# 创建地图，使用保存的状态
@@ -565,8 +2091,9 @@ def main():
 		# 首先显示未选中的轨迹
 		for segment in segments:
 			if not segment.selected:
+				# 未选中的段直接从压缩数据生成折线，不恢复为列表
 				folium.PolyLine(
-					segment.coordinates,
+					segment.polyline(),
 					weight=3,
 					color='blue',
 					opacity=0.8
@@ -688,7 +2215,7 @@ def main():
 			if col4.button(f"🔄 反转###{segment.order}"):
 				st.session_state.segment_mgr.reverse_segment(segment)
 				st.experimental_rerun()
-			if col5.button(f"📋 复制###{segment.order}"):
+			if col5.button(f"📋 复制###{segment.order}") and check_memory_room(len(segment.coordinates)):
 				st.session_state.segment_mgr.duplicate_segment(segment)
 				st.experimental_rerun()
 			if col6.button(f"🗑️ 删除###{segment.order}"):
@@ -773,81 +2300,69 @@ def main():
 							  for i in range(len(segment.coordinates)-1))
 			st.write(f"总距离：{total_distance/1000:.2f}km")
 			
-			# 计算每公里的爬升和下降
-			km_stats = []
-			accumulated_distance = 0
-			last_km = 0
-			last_point = segment.coordinates[0]
-			last_elevation = segment.elevations[0]
-			current_km_ascent = 0
-			current_km_descent = 0
-			current_km_start_distance = 0
-			total_ascent = 0
-			total_descent = 0
+			# 海拔剖面图（降采样显示，橙色为分裂点）
+			st.write("海拔剖面：")
+			render_elevation_profile(segment)
 			
-			for i in range(1, len(segment.coordinates)):
-				point = segment.coordinates[i]
-				elevation = segment.elevations[i]
-				
-				# 计算距离
-				distance = calculate_distance(last_point, point)
-				accumulated_distance += distance
-				
-				# 计算高度变化
-				elevation_change = elevation - last_elevation
-				if elevation_change > 0:
-					current_km_ascent += elevation_change
-					total_ascent += elevation_change
-				else:
-					current_km_descent += abs(elevation_change)
-					total_descent += abs(elevation_change)
-				
-				# 如果超过1公里或是最后一个点，记录统计数据
-				current_km = int(accumulated_distance / 1000)
-				if current_km > last_km or i == len(segment.coordinates) - 1:
-					km_distance = accumulated_distance - current_km_start_distance
-					km_stats.append({
-						"公里数": f"第{last_km + 1}公里",
-						"实际距离": f"{km_distance:.0f}m",
-						"爬升": f"{current_km_ascent:.1f}m",
-						"下降": f"{current_km_descent:.1f}m"
-					})
-					current_km_ascent = 0
-					current_km_descent = 0
-					last_km = current_km
-					current_km_start_distance = accumulated_distance
-				
-				last_point = point
-				last_elevation = elevation
-			
-			# 添加汇总行
-			km_stats.append({
-				"公里数": "总计",
-				"实际距离": f"{accumulated_distance:.0f}m",
-				"爬升": f"{total_ascent:.1f}m",
-				"下降": f"{total_descent:.1f}m"
-			})
-			
-			# 显示统计表格
+			# 计算每公里的爬升和下降（使用过滤跳点、平滑海拔后的数据，与修正后的累计值一致）
 			st.write("每公里爬升下降统计：")
-			st.table(km_stats)
+			st.table(km_statistics(segment))
+			st.write(f"已剔除跳点 {filter_segment(segment)['removed']} 个，海拔经中值平滑和滞回过滤")
 			st.write("---")
 
+	# 轨迹对比
+	if len(segments) > 1:
+		render_segment_comparison(segments)
+	
 	# 底部按钮区域
 	st.write("---")
 	
 	# 第一行：导出按钮
 	if len(segments) > 0:
 		col1, col2 = st.columns(2)
-		if col1.button("导出为KML", key="export_kml"):
-			kml_content = export_to_kml(segments)
+		split_files = col1.checkbox("每段导出为KMZ中的单独文件", key="export_split")
+		# 导航设备的点数上限：按每段或总点数简化
+		budget_mode = col1.selectbox("点数上限", ["不限制", "每段", "总计"], key="export_budget_mode")
+		if budget_mode != "不限制":
+			budget = int(col1.number_input("最大点数", min_value=10, value=EXPORT_DEFAULT_BUDGET, step=1000,
+										   key="export_budget"))
+		if col1.button("导出为KMZ" if split_files else "导出为KML", key="export_kml"):
+			simplified = None
+			if budget_mode != "不限制":
+				simplified = simplify_to_budget(segments,
+												segment_budget=budget if budget_mode == "每段" else None,
+												total_budget=budget if budget_mode == "总计" else None)
+				kept = sum(len(indices) for indices, _ in simplified.values())
+				deviation = max(deviation for _, deviation in simplified.values())
+				col1.info(f"简化后共 {kept} 个点（原 {sum(s.point_count for s in segments)} 个），最大偏差 {deviation:.2f} 米")
+				if budget_mode == "总计" and kept > budget or budget_mode == "每段" and any(
+						len(indices) > budget for indices, _ in simplified.values()):
+					col1.warning("点数上限低于必须保留的首尾点和海拔极值点数，结果超出上限")
 			# 创建下载链接
+			if split_files:
+				st.download_button(
+					label="点击下载KMZ文件",
+					data=export_to_kmz(segments, simplified),
+					file_name="exported_tracks.kmz",
+					mime="application/vnd.google-earth.kmz",
+					key="download_kml"
+				)
+			else:
+				st.download_button(
+					label="点击下载KML文件",
+					data=export_to_kml(segments, simplified),
+					file_name="exported_tracks.kml",
+					mime="application/vnd.google-earth.kml+xml",
+					key="download_kml"
+				)
+		
+		if col2.button("导出为Parquet", key="export_parquet"):
 			st.download_button(
-				label="点击下载KML文件",
-				data=kml_content,
-				file_name="exported_tracks.kml",
-				mime="application/vnd.google-earth.kml+xml",
-				key="download_kml"
+				label="点击下载Parquet文件",
+				data=export_to_parquet(segments),
+				file_name="exported_tracks.parquet",
+				mime="application/octet-stream",
+				key="download_parquet"
 			)
 	
 	# 第二行：存档相关按钮
@@ -0,0 +1,127 @@
+"""轨迹导入基准：对每种导入格式生成同一条合成轨迹，报告解析吞吐量和峰值内存
+
+吞吐量取多次运行中最快的一次；峰值内存由 tracemalloc 单独测一次（不含输入文件本身）。
+
+用法：
+	python bench_parse.py --points 200000 --repeat 3 > bench_output.txt
+"""
+import argparse
+import json
+import struct
+import time
+import tracemalloc
+import zipfile
+from io import BytesIO
+
+import numpy as np
+
+import app
+
+def synthetic_track(points, seed=0):
+	"""带海拔起伏和 GPS 噪声的合成轨迹"""
+	rng = np.random.default_rng(seed)
+	t = np.linspace(0, 1, points)
+	lat = 30 + t * 0.2 + rng.normal(0, 2e-5, points)
+	lon = 120 + t * 0.2 + 0.01 * np.sin(t * 20)
+	ele = 500 + 300 * np.sin(t * 8) + rng.normal(0, 2, points)
+	return lat, lon, ele
+
+def to_kml(lat, lon, ele):
+	coords = "".join(f"<gx:coord>{x:.7f} {y:.7f} {z:.1f}</gx:coord>\n" for x, y, z in zip(lon, lat, ele))
+	return f"""<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2">
+<Document><Placemark><gx:Track>
+{coords}</gx:Track></Placemark></Document>
+</kml>""".encode()
+
+def to_kmz(lat, lon, ele):
+	buffer = BytesIO()
+	with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+		zf.writestr("doc.kml", to_kml(lat, lon, ele))
+	return buffer.getvalue()
+
+def to_gpx(lat, lon, ele):
+	points = "".join(f'<trkpt lat="{y:.7f}" lon="{x:.7f}"><ele>{z:.1f}</ele></trkpt>\n' for x, y, z in zip(lon, lat, ele))
+	return f"""<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" creator="bench" xmlns="http://www.topografix.com/GPX/1/1">
+<trk><name>bench</name><trkseg>
+{points}</trkseg></trk>
+</gpx>""".encode()
+
+def to_geojson(lat, lon, ele, features=10):
+	"""拆成多个要素，覆盖逐要素流式解码的路径"""
+	coords = np.round(np.column_stack((lon, lat, ele)), 7)
+	collection = {
+		"type": "FeatureCollection",
+		"features": [{"type": "Feature", "properties": {"index": i},
+					  "geometry": {"type": "LineString", "coordinates": part.tolist()}}
+					 for i, part in enumerate(np.array_split(coords, features))],
+	}
+	return json.dumps(collection).encode()
+
+def to_fit(lat, lon, ele):
+	"""最小的 FIT 活动文件：file_id 消息加 record 消息（时间戳、经纬度、enhanced_altitude）"""
+	messages = BytesIO()
+	# file_id 定义（本地类型 0）和数据：type、time_created
+	messages.write(struct.pack('<BBBHB', 0x40, 0, 0, 0, 2) + bytes([0, 1, 0x00, 4, 4, 0x86]))
+	messages.write(struct.pack('<BBI', 0x00, 4, 1000000000))
+	# record 定义（本地类型 1）：timestamp、position_lat、position_long、enhanced_altitude
+	messages.write(struct.pack('<BBBHB', 0x41, 0, 0, 20, 4)
+				   + bytes([253, 4, 0x86, 0, 4, 0x85, 1, 4, 0x85, 78, 4, 0x86]))
+	records = np.zeros(len(lat), dtype=[('header', 'u1'), ('timestamp', '<u4'), ('lat', '<i4'),
+										('lon', '<i4'), ('altitude', '<u4')])
+	records['header'] = 0x01
+	records['timestamp'] = 1000000000 + np.arange(len(lat))
+	records['lat'] = np.round(lat / app.FIT_SEMICIRCLE)
+	records['lon'] = np.round(lon / app.FIT_SEMICIRCLE)
+	records['altitude'] = np.round((ele + 500) * 5)
+	messages.write(records.tobytes())
+	data = messages.getvalue()
+	header = struct.pack('<BBHI4sH', 14, 0x10, 2100, len(data), b'.FIT', 0)
+	# 解码器不校验 CRC，这里写 0
+	return header + data + b'\x00\x00'
+
+FORMATS = {
+	'.kml': to_kml,
+	'.kmz': to_kmz,
+	'.gpx': to_gpx,
+	'.geojson': to_geojson,
+	'.fit': to_fit,
+}
+
+def parse(extension, data):
+	points = app.PointBuffer()
+	app.TRACK_IMPORTERS[extension](data, points)
+	return points
+
+def bench(extension, data, repeat):
+	"""返回 (最快耗时, 解析出的点数, 峰值内存)"""
+	best = float('inf')
+	for _ in range(repeat):
+		start = time.perf_counter()
+		points = parse(extension, data)
+		best = min(best, time.perf_counter() - start)
+	tracemalloc.start()
+	parse(extension, data)
+	_, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	return best, len(points), peak
+
+def main():
+	parser = argparse.ArgumentParser(description="轨迹导入解析基准")
+	parser.add_argument("--points", type=int, default=200000, help="合成轨迹的点数")
+	parser.add_argument("--repeat", type=int, default=3, help="每种格式的运行次数")
+	parser.add_argument("--formats", nargs="+", default=list(FORMATS), help="要测试的扩展名")
+	args = parser.parse_args()
+
+	lat, lon, ele = synthetic_track(args.points)
+	print(f"{'格式':<9} {'文件(MB)':>9} {'点数':>9} {'耗时(s)':>8} {'点/s':>11} {'MB/s':>8} {'峰值内存(MB)':>13}")
+	for extension in args.formats:
+		data = FORMATS[extension](lat, lon, ele)
+		elapsed, count, peak = bench(extension, data, args.repeat)
+		size = len(data) / 1024 / 1024
+		print(f"{extension:<9} {size:>9.2f} {count:>9} {elapsed:>8.3f} {count / elapsed:>11.0f} "
+			  f"{size / elapsed:>8.1f} {peak / 1024 / 1024:>13.1f}")
+
+if __name__ == "__main__":
+	main()
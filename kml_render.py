@@ -0,0 +1,30 @@
+"""KML 片段渲染
+
+导出时在工作进程中调用，因此放在独立模块中：app.py 在 Streamlit 中以
+__main__ 运行，其中定义的函数无法被子进程按名称导入。
+"""
+
+def render_placemark(name, stats, lat, lon, elevations):
+	"""渲染一个轨迹段的 Placemark 片段
+
+	stats 为 points、distance、max_elevation、min_elevation、ascent、descent；
+	lat、lon、elevations 为 numpy 数组。
+	"""
+	coords = "".join(map("					<gx:coord>{} {} {}</gx:coord>\n".format,
+						 lon.tolist(), lat.tolist(), elevations.tolist()))
+	return f"""			<Placemark>
+				<name><![CDATA[{name}]]></name>
+				<description><![CDATA[
+					<div>通过"KML轨迹编辑器"生成</div>
+					<div>轨迹点数:{stats['points']}</div>
+					<div>本段里程:{stats['distance']:.2f}米</div>
+					<div>最高海拔:{stats['max_elevation']:.2f}米</div>
+					<div>最低海拔:{stats['min_elevation']:.2f}米</div>
+					<div>累计爬升:{stats['ascent']:.2f}米</div>
+					<div>累计下降:{stats['descent']:.2f}米</div>
+				]]></description>
+				<styleUrl>#TbuluTrackStyle</styleUrl>
+				<gx:Track>
+{coords}				</gx:Track>
+			</Placemark>
+"""
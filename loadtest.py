@@ -0,0 +1,228 @@
+"""多会话压力测试：用 Streamlit 的无界面 AppTest 并发运行 app.py
+
+每个模拟会话依次执行：导入合成的 KMZ 轨迹、选中轨迹段、移动分裂点、分割、
+裁剪起点终点、导出 KML，并记录每次重新运行的耗时。按并发数逐级报告
+重新运行的 p50/p95 延迟、导入耗时、吞吐量和进程 RSS。
+
+用法：
+	python loadtest.py --sessions 1 2 4 8 --points 20000
+"""
+import argparse
+import math
+import os
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from unittest.mock import MagicMock
+
+import numpy as np
+from streamlit.runtime import Runtime
+from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+from streamlit.runtime.scriptrunner import RerunData, ScriptRunner, ScriptRunnerEvent
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1.element_tree import parse_tree_from_messages
+from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+
+import app
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+POLL_INTERVAL = 0.002  # 等待脚本运行结束的轮询间隔（秒）
+
+def install_runtime():
+	"""安装所有会话共用的模拟 Runtime
+
+	AppTest 每次运行都会替换并清空全局 Runtime，多个会话并发时会互相干扰，
+	因此这里只安装一次，由 HeadlessAppTest 跳过逐次的替换。
+	"""
+	runtime = MagicMock(spec=Runtime)
+	runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+	runtime.cache_storage_manager = MemoryCacheStorageManager()
+	Runtime._instance = runtime
+
+class HeadlessScriptRunner(LocalScriptRunner):
+	"""等待脚本（包括脚本内 st.experimental_rerun 触发的重跑）完全结束
+
+	LocalScriptRunner 在第一次停止时就返回，且每 0.1 秒轮询一次；这里改为
+	等待最终结束并细粒度轮询，延迟统计才准确。
+	"""
+	def __init__(self, script_path, session_state):
+		super().__init__(script_path, session_state)
+		self._session_id = uuid.uuid4().hex
+
+	def _on_script_finished(self, ctx, event, premature_stop):
+		# 与正式运行一致，结束时重置按钮等触发器；否则脚本内重跑会再次触发同一个按钮
+		ScriptRunner._on_script_finished(self, ctx, event, premature_stop)
+
+	def run(self, widget_state=None, query_params=None, timeout=3):
+		self.request_rerun(RerunData(widget_states=widget_state))
+		if not self._script_thread:
+			self.start()
+		# 脚本内请求的重跑以 SCRIPT_STOPPED_FOR_RERUN 结束，需继续等待
+		finished = (ScriptRunnerEvent.SCRIPT_STOPPED_WITH_SUCCESS, ScriptRunnerEvent.SCRIPT_STOPPED_WITH_COMPILE_ERROR)
+		deadline = time.perf_counter() + timeout
+		while not any(event in finished for event in self.events):
+			if time.perf_counter() > deadline:
+				self.request_stop()
+				raise RuntimeError(f"脚本运行超时（{timeout}s）")
+			time.sleep(POLL_INTERVAL)
+		self.request_stop()
+		self.join()
+		# 只取最后一次运行输出的消息，与浏览器看到的页面一致
+		last_start = max(i for i, event in enumerate(self.events) if event == ScriptRunnerEvent.SCRIPT_STARTED)
+		messages = [data['forward_msg'] for event, data in zip(self.events[last_start:], self.event_data[last_start:])
+					if event == ScriptRunnerEvent.ENQUEUE_FORWARD_MSG]
+		return parse_tree_from_messages(messages)
+
+class HeadlessAppTest(AppTest):
+	"""使用 HeadlessScriptRunner、可多线程并发运行的 AppTest"""
+	def _run(self, widget_state=None, timeout=None):
+		runner = HeadlessScriptRunner(self._script_path, self.session_state)
+		self._tree = runner.run(widget_state, timeout=timeout or self.default_timeout)
+		self._tree._runner = self
+		return self._tree
+
+class UploadedKMZ:
+	"""模拟 st.file_uploader 返回的文件对象"""
+	def __init__(self, name, data):
+		self.name = name
+		self._data = data
+
+	def getvalue(self):
+		return self._data
+
+def synthetic_kmz(points, seed):
+	"""生成一条带海拔起伏和 GPS 噪声的合成轨迹，打包为 KMZ"""
+	rng = np.random.default_rng(seed)
+	t = np.linspace(0, 1, points)
+	lat = 30 + t * 0.2 + rng.normal(0, 2e-5, points)
+	lon = 120 + t * 0.2 + 0.01 * np.sin(t * 20)
+	ele = 500 + 300 * np.sin(t * 8) + rng.normal(0, 2, points)
+	coords = "\n".join(f"<gx:coord>{x:.7f} {y:.7f} {z:.1f}</gx:coord>" for x, y, z in zip(lon, lat, ele))
+	kml = f"""<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2">
+<Document><Placemark><gx:Track>
+{coords}
+</gx:Track></Placemark></Document>
+</kml>"""
+	buffer = BytesIO()
+	with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+		zf.writestr("track.kml", kml)
+	return buffer.getvalue()
+
+def process_rss():
+	"""当前进程 RSS（字节）"""
+	with open("/proc/self/statm") as f:
+		return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def sidebar_button(at, label):
+	"""按标签查找侧边栏按钮"""
+	return next(button for button in at.sidebar.button if button.label == label)
+
+class Session:
+	"""一个模拟编辑会话，分别记录每次重新运行和导入的耗时"""
+	def __init__(self, kmz, timeout):
+		self.kmz = kmz
+		self.at = HeadlessAppTest(APP_PATH, default_timeout=timeout)
+		self.latencies = []
+		self.upload_latencies = []
+
+	def run(self):
+		start = time.perf_counter()
+		self.at.run()
+		self.latencies.append(time.perf_counter() - start)
+		if self.at.exception:
+			raise RuntimeError(self.at.exception[0].message)
+
+	def upload(self):
+		"""AppTest 不支持 file_uploader，这里用 import_track 解析后直接写入会话状态"""
+		start = time.perf_counter()
+		coordinates, elevations = app.import_track(UploadedKMZ("synthetic.kmz", self.kmz)).to_lists()
+		segment = app.Segment("Segment A", coordinates, elevations, 0)
+		state = self.at.session_state
+		state["segments"] = [segment]
+		state["file_names"] = {"synthetic.kmz"}
+		state["next_order"] = 1
+		state["next_segment_letter"] = "B"
+		state["has_uploaded"] = True
+		# 导入不是重新运行，单独记录，避免混入重新运行的 p50/p95
+		self.upload_latencies.append(time.perf_counter() - start)
+
+	def select(self, order):
+		self.at.checkbox(key=f"segment_{order}").check()
+		self.run()
+
+	def click(self, label):
+		sidebar_button(self.at, label).click()
+		self.run()
+
+	def script(self):
+		"""一次完整的编辑流程"""
+		self.run()
+		self.upload()
+		self.run()
+		self.select(0)
+		self.click("➡️10###0")
+		self.click("✂️###0")
+		self.select(0)
+		self.click("起+10###0")
+		self.click("终-10###0")
+		self.at.button(key="export_kml").click()
+		self.run()
+
+def run_level(concurrency, kmz_files, timeout):
+	"""以给定并发数运行一轮会话，返回该轮统计"""
+	sessions = [Session(kmz_files[i % len(kmz_files)], timeout) for i in range(concurrency)]
+	peak_rss = process_rss()
+	done = threading.Event()
+
+	def sample_rss():
+		nonlocal peak_rss
+		while not done.wait(0.05):
+			peak_rss = max(peak_rss, process_rss())
+
+	sampler = threading.Thread(target=sample_rss, daemon=True)
+	sampler.start()
+	start = time.perf_counter()
+	with ThreadPoolExecutor(max_workers=concurrency) as pool:
+		errors = [f.exception() for f in [pool.submit(session.script) for session in sessions]]
+	elapsed = time.perf_counter() - start
+	done.set()
+	sampler.join()
+
+	latencies = np.array([latency for session in sessions for latency in session.latencies])
+	uploads = np.array([latency for session in sessions for latency in session.upload_latencies])
+	return {
+		'concurrency': concurrency,
+		'reruns': len(latencies),
+		'p50': float(np.percentile(latencies, 50)) if len(latencies) else math.nan,
+		'p95': float(np.percentile(latencies, 95)) if len(latencies) else math.nan,
+		'upload_p50': float(np.percentile(uploads, 50)) if len(uploads) else math.nan,
+		'throughput': len(latencies) / elapsed,
+		'rss': peak_rss,
+		'errors': [str(error) for error in errors if error is not None],
+	}
+
+def main():
+	parser = argparse.ArgumentParser(description="轨迹编辑器多会话压力测试")
+	parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8], help="依次测试的并发会话数")
+	parser.add_argument("--points", type=int, default=20000, help="每个合成轨迹的点数")
+	parser.add_argument("--timeout", type=float, default=120, help="单次重新运行的超时（秒）")
+	args = parser.parse_args()
+
+	install_runtime()
+	kmz_files = [synthetic_kmz(args.points, seed) for seed in range(4)]
+	print(f"{'并发':>4} {'运行次数':>8} {'p50(ms)':>9} {'p95(ms)':>9} {'导入p50(ms)':>11} {'吞吐(次/s)':>11} {'峰值RSS(MB)':>12}")
+	for concurrency in args.sessions:
+		result = run_level(concurrency, kmz_files, args.timeout)
+		print(f"{result['concurrency']:>4} {result['reruns']:>8} {result['p50'] * 1000:>9.1f} "
+			  f"{result['p95'] * 1000:>9.1f} {result['upload_p50'] * 1000:>11.1f} {result['throughput']:>11.2f} {result['rss'] / 1024 / 1024:>12.1f}")
+		for error in result['errors']:
+			print(f"     错误：{error}")
+
+if __name__ == "__main__":
+	main()
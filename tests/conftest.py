@@ -0,0 +1,26 @@
+"""测试共用配置：把仓库根目录加入导入路径，以便直接 import app"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+
+class SessionState(dict):
+	"""代替 st.session_state：脱离 streamlit 运行时，支持属性和键两种访问方式"""
+	def __getattr__(self, key):
+		try:
+			return self[key]
+		except KeyError:
+			raise AttributeError(key)
+
+	def __setattr__(self, key, value):
+		self[key] = value
+
+@pytest.fixture
+def session_state(monkeypatch):
+	state = SessionState()
+	monkeypatch.setattr(app.st, "session_state", state)
+	return state
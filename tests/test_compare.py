@@ -0,0 +1,73 @@
+"""最近点搜索与离散 Fréchet 距离测试：与暴力计算和朴素动态规划对照，并检查对比结果的缓存"""
+import gc
+import weakref
+
+import numpy as np
+import pytest
+
+import app
+
+def naive_nearest(query, ref):
+	d = np.hypot(*(query[:, None, :] - ref[None, :, :]).transpose(2, 0, 1))
+	return d.min(axis=1)
+
+def naive_frechet(a, b):
+	d = np.hypot(*(a[:, None, :] - b[None, :, :]).transpose(2, 0, 1))
+	cost = np.full(d.shape, np.inf)
+	for i in range(len(a)):
+		for j in range(len(b)):
+			if i == 0 and j == 0:
+				previous = 0.0
+			else:
+				previous = min(cost[i - 1, j] if i else np.inf, cost[i, j - 1] if j else np.inf,
+							   cost[i - 1, j - 1] if i and j else np.inf)
+			cost[i, j] = max(previous, d[i, j])
+	return cost[-1, -1]
+
+def random_walk(rng, n, scale=5.0):
+	return np.cumsum(rng.normal(0, scale, (n, 2)), axis=0)
+
+@pytest.mark.parametrize("offset", [0.0, 30.0, 1000.0])
+def test_nearest_neighbors_matches_brute_force(offset):
+	rng = np.random.default_rng(1)
+	for _ in range(30):
+		query = random_walk(rng, int(rng.integers(1, 300))) + offset
+		ref = random_walk(rng, int(rng.integers(1, 2000)))
+		indices, distances = app.nearest_neighbors(query, ref)
+		expected = naive_nearest(query, ref)
+		np.testing.assert_allclose(distances, expected)
+		np.testing.assert_allclose(np.hypot(*(query - ref[indices]).T), expected)
+
+@pytest.mark.filterwarnings("error")
+def test_discrete_frechet_matches_dynamic_programming():
+	rng = np.random.default_rng(2)
+	for trial in range(90):
+		base = random_walk(rng, 80)
+		a = base[np.sort(rng.choice(80, int(rng.integers(1, 50)), replace=False))] + rng.normal(0, 2, (1, 2))
+		b = base[np.sort(rng.choice(80, int(rng.integers(1, 50)), replace=False))]
+		if trial % 3 == 1:
+			b = b[::-1]
+		elif trial % 3 == 2:
+			# 往返轨迹与它的完全副本或反向副本：Hausdorff 距离为 0，最近点可能落在回程上
+			a = np.concatenate((a, a[::-1]))
+			b = a.copy() if trial % 2 else a[::-1].copy()
+		nearest_ab, dist_ab = app.nearest_neighbors(a, b)
+		_, dist_ba = app.nearest_neighbors(b, a)
+		frechet, lower, exact = app.discrete_frechet(a, b, nearest_ab, max(dist_ab.max(), dist_ba.max()))
+		assert exact
+		assert frechet == pytest.approx(naive_frechet(a, b))
+
+def test_compare_cache_does_not_keep_second_alive():
+	t = np.arange(200)
+	first = app.Segment.from_arrays("A", 30 + t * 1e-5, np.full(200, 120.0), np.zeros(200), 0)
+	second = app.Segment.from_arrays("B", 30 + t * 1e-5, np.full(200, 120.0001), np.zeros(200), 1)
+	result = app.compare_segments(first, second)
+	assert app.compare_segments(first, second) is result
+	# second 修改后重新计算，并覆盖旧版本的结果
+	second.mark_modified()
+	assert app.compare_segments(first, second) is not result
+	assert sum(1 for key in first._cache if key[0] == 'compare') == 1
+	reference = weakref.ref(second)
+	del second
+	gc.collect()
+	assert reference() is None
@@ -0,0 +1,101 @@
+"""冷数据压缩测试：pack_track/unpack_track 往返误差，以及压缩状态下的轨迹段操作"""
+import numpy as np
+import pytest
+
+import app
+
+def delta_widths(packed):
+	"""读出纬度、经度、海拔三列的差分宽度（字节）"""
+	n = int(np.frombuffer(packed, dtype=np.uint32, count=1)[0])
+	offset, widths = 4, []
+	for _ in range(3):
+		widths.append(packed[offset])
+		offset += 9 + max(n - 1, 0) * packed[offset]
+	assert offset == len(packed)
+	return widths
+
+def assert_round_trip(lat, lon, ele):
+	packed = app.pack_track(np.column_stack((lat, lon)), ele)
+	lat2, lon2, ele2 = app.unpack_track(packed)
+	assert len(lat2) == len(lon2) == len(ele2) == len(lat)
+	assert np.all(np.abs(lat2 - lat) <= 5e-7 + 1e-12)
+	assert np.all(np.abs(lon2 - lon) <= 5e-7 + 1e-12)
+	assert np.all(np.abs(ele2 - ele) <= 0.05 + 1e-9)
+	return packed
+
+@pytest.mark.parametrize("n", [0, 1, 2])
+def test_round_trip_short_tracks(n):
+	lat, lon, ele = 30 + np.arange(n) * 1e-4, 120 - np.arange(n) * 1e-4, 500.0 + np.arange(n)
+	packed = assert_round_trip(lat, lon, ele)
+	assert len(packed) == 4 + 3 * (9 + max(n - 1, 0))
+
+@pytest.mark.parametrize("step, ele_step, widths", [
+	(1e-5, 1.0, [1, 1, 1]),         # 约 1 米的点距
+	(1e-3, 1000.0, [2, 2, 2]),      # 需要 int16
+	(1.0, 1e6, [4, 4, 4]),          # 需要 int32
+	(1.0, 1e9, [4, 4, 8]),          # 海拔差分超过 int32（经纬度差分不会超过）
+])
+def test_round_trip_delta_widths(step, ele_step, widths):
+	rng = np.random.default_rng(0)
+	n = 1000
+	lat = np.clip(np.cumsum(rng.uniform(-step, step, n)), -89, 89)
+	lon = 120 + np.cumsum(rng.uniform(-step, step, n))
+	ele = np.cumsum(rng.uniform(-ele_step, ele_step, n))
+	assert delta_widths(assert_round_trip(lat, lon, ele)) == widths
+
+def test_round_trip_error_bounds():
+	rng = np.random.default_rng(1)
+	n = 100000
+	lat = rng.uniform(-90, 90, n)
+	lon = rng.uniform(-180, 180, n)
+	ele = rng.uniform(-500, 9000, n)
+	assert_round_trip(lat, lon, ele)
+
+def make_segment(n=100):
+	rng = np.random.default_rng(2)
+	coordinates = np.column_stack((30 + np.cumsum(rng.normal(0, 1e-5, n)), 120 + np.cumsum(rng.normal(0, 1e-5, n))))
+	elevations = 500 + np.cumsum(rng.normal(0, 1, n))
+	segment = app.Segment("Segment A", coordinates.tolist(), elevations.tolist(), 0)
+	segment.split_point_index = 30
+	segment.compress()
+	return segment, np.round(coordinates, 6).tolist(), np.round(elevations, 1).tolist()
+
+def assert_points(segment, coordinates, elevations):
+	np.testing.assert_allclose(segment.coordinates, coordinates, atol=1e-9)
+	np.testing.assert_allclose(segment.elevations, elevations, atol=1e-9)
+
+def test_decompress_restores_lists():
+	segment, coordinates, elevations = make_segment()
+	assert segment.compressed and segment.point_count == 100
+	assert_points(segment, coordinates, elevations)
+	assert not segment.compressed
+	assert isinstance(segment.coordinates, list) and isinstance(segment.elevations, list)
+
+def test_reverse_compressed_segment(session_state):
+	manager = app.SegmentManager()
+	segment, coordinates, elevations = make_segment()
+	manager.reverse_segment(segment)
+	assert_points(segment, coordinates[::-1], elevations[::-1])
+	assert segment.split_point_index == 69
+
+def test_move_start_of_compressed_segment(session_state):
+	manager = app.SegmentManager()
+	segment, coordinates, elevations = make_segment()
+	manager.move_split_point(segment, 'start_forward')
+	assert_points(segment, coordinates[10:], elevations[10:])
+	assert segment.split_point_index == 20
+	assert segment.point_count == 90
+
+def test_duplicate_compressed_segment(session_state):
+	manager = app.SegmentManager()
+	segment, coordinates, elevations = make_segment()
+	session_state.segments.append(segment)
+	manager.update_segment_orders()
+	copy = manager.duplicate_segment(segment)
+	assert_points(copy, coordinates, elevations)
+	assert copy.split_point_index == 30
+	assert copy.coordinates is not segment.coordinates
+	# 再次压缩原段不影响副本
+	segment.compress()
+	assert_points(copy, coordinates, elevations)
+	assert [s.order for s in session_state.segments] == [0, 1]
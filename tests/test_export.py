@@ -0,0 +1,21 @@
+"""KML 导出测试"""
+import numpy as np
+
+import app
+
+def test_export_uses_current_name_after_rename():
+	segment = app.Segment("Segment A", [[30.0, 120.0], [30.001, 120.001], [30.002, 120.0]], [1.0, 2.0, 3.0], 0)
+	app.export_to_kml([segment])
+	segment.name = "Renamed"
+	kml = app.export_to_kml([segment])
+	assert "Renamed" in kml and "Segment A" not in kml
+
+def test_compress_releases_kml_fragment():
+	segment = app.Segment.from_arrays("Segment A", 30 + np.arange(2000) * 1e-5, np.full(2000, 120.0),
+									  np.full(2000, 500.0), 0)
+	kml = app.export_to_kml([segment])
+	assert 'kml' in segment._cache
+	segment.compress()
+	assert 'kml' not in segment._cache
+	assert app.segment_memory(segment)['cache'] < len(segment._packed)
+	assert app.export_to_kml([segment]) == kml
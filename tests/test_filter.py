@@ -0,0 +1,32 @@
+"""跳点过滤与分公里统计测试"""
+import numpy as np
+import pytest
+
+import app
+
+def test_filter_keeps_sparse_tracks():
+	# 约 333 米点距的规划路线不应被当作跳点
+	t = np.arange(100)
+	segment = app.Segment.from_arrays("S", 30 + t * 0.003, np.full(100, 120.0), 500 + 300 * np.sin(t / 10), 0)
+	filtered = app.filter_segment(segment)
+	assert filtered['removed'] == 0
+	assert filtered['ascent'] > 500
+
+def test_filter_removes_spikes():
+	n = 2000
+	lat = 30 + np.arange(n) * 1e-5
+	lat[[100, 1500]] += 0.01
+	segment = app.Segment.from_arrays("S", lat, np.full(n, 120.0), np.full(n, 500.0), 0)
+	filtered = app.filter_segment(segment)
+	assert filtered['removed'] == 2
+	assert not filtered['mask'][100] and not filtered['mask'][1500]
+
+def test_km_statistics_total_matches_filtered():
+	rng = np.random.default_rng(0)
+	n = 3000
+	segment = app.Segment.from_arrays("S", 30 + np.arange(n) * 1e-5, np.full(n, 120.0),
+									  500 + np.cumsum(rng.normal(0, 1, n)), 0)
+	rows = app.km_statistics(segment)
+	filtered = app.filter_segment(segment)
+	assert rows[-1]["爬升"] == f"{filtered['ascent']:.1f}m"
+	assert sum(float(row["爬升"][:-1]) for row in rows[:-1]) == pytest.approx(filtered['ascent'], abs=0.1 * len(rows))
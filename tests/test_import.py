@@ -0,0 +1,31 @@
+"""轨迹导入测试"""
+import pytest
+
+import app
+
+class UploadedFile:
+	"""模拟 st.file_uploader 返回的文件对象"""
+	def __init__(self, name, data):
+		self.name = name
+		self._data = data
+
+	def getvalue(self):
+		return self._data
+
+def test_gpx_waypoint_elevation_does_not_leak():
+	gpx = (b'<gpx><wpt lat="1" lon="1"><ele>999</ele></wpt><trk><trkseg>'
+		   b'<trkpt lat="2" lon="3"/><trkpt lat="4" lon="5"><ele>7</ele></trkpt></trkseg></trk></gpx>')
+	coordinates, elevations = app.import_track(UploadedFile("a.gpx", gpx)).to_lists()
+	assert coordinates == [[2.0, 3.0], [4.0, 5.0]]
+	assert elevations == [0.0, 7.0]
+
+@pytest.mark.parametrize("text, coordinates, elevations", [
+	("1,2,3 4,5,6", [[2.0, 1.0], [5.0, 4.0]], [3.0, 6.0]),
+	("1,2\n\t4,5", [[2.0, 1.0], [5.0, 4.0]], [0.0, 0.0]),
+	("1,2,3 4,5", [[2.0, 1.0], [5.0, 4.0]], [3.0, 0.0]),
+	("1,2 4,5,6", [[2.0, 1.0], [5.0, 4.0]], [0.0, 6.0]),
+	("1, 2, 3  4 ,5 , 6", [[2.0, 1.0], [5.0, 4.0]], [3.0, 6.0]),
+])
+def test_kml_coordinates(text, coordinates, elevations):
+	kml = f'<kml><Placemark><LineString><coordinates>{text}</coordinates></LineString></Placemark></kml>'
+	assert app.import_track(UploadedFile("a.kml", kml.encode())).to_lists() == (coordinates, elevations)
@@ -0,0 +1,64 @@
+"""Parquet 列式导出与导入测试"""
+from io import BytesIO
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import app
+
+class UploadedFile:
+	"""模拟 st.file_uploader 返回的文件对象"""
+	def __init__(self, name, data):
+		self.name = name
+		self._data = data
+
+	def getvalue(self):
+		return self._data
+
+def make_segment(name, n, order, seed):
+	rng = np.random.default_rng(seed)
+	coordinates = np.column_stack((30 + np.cumsum(rng.normal(0, 1e-5, n)), 120 + np.cumsum(rng.normal(0, 1e-5, n))))
+	return app.Segment(name, coordinates.tolist(), (500 + np.cumsum(rng.normal(0, 1, n))).tolist(), order)
+
+def test_round_trip_keeps_duplicate_names_and_split_points():
+	segments = [make_segment("Segment A", 50, 0, 0), make_segment("Segment A", 80, 1, 1), make_segment("B", 2, 2, 2)]
+	segments[0].split_point_index = 7
+	segments[1].split_point_index = 79
+	# 导出按 order 排序，与传入顺序无关；其中一段处于压缩状态
+	segments[2].compress()
+	imported = app.parse_parquet(UploadedFile("a.parquet", app.export_to_parquet(segments[::-1])))
+	assert [(s.name, s.order, s.split_point_index, s.point_count) for s in imported] == [
+		("Segment A", 0, 7, 50), ("Segment A", 1, 79, 80), ("B", 2, 1, 2)]
+	# 导入的段处于压缩状态，误差在量化精度以内
+	for original, restored in zip(segments, imported):
+		for expected, actual, tolerance in zip(original.point_arrays(), restored.point_arrays(), (5e-7, 5e-7, 0.05)):
+			np.testing.assert_allclose(actual, expected, rtol=0, atol=tolerance + 1e-9)
+
+def test_metadata_summaries():
+	segments = [make_segment("Segment A", 50, 0, 0), make_segment("Segment A", 80, 1, 1)]
+	table = pq.read_table(BytesIO(app.export_to_parquet(segments)))
+	summaries = app.json.loads(table.schema.metadata[app.PARQUET_METADATA_KEY])
+	assert [summary['points'] for summary in summaries] == [50, 80]
+	assert summaries[1]['max_elevation'] == max(segments[1].elevations)
+
+def test_import_table_without_metadata_or_optional_columns():
+	# 外部流水线生成的表：只有 segment_id、lat、lon、elevation，行顺序被打乱
+	table = pa.table({
+		'segment_id': np.array([7, 3, 7, 3, 7], dtype=np.int64),
+		'lat': [1.0, 10.0, 2.0, 11.0, 3.0],
+		'lon': [4.0, 20.0, 5.0, 21.0, 6.0],
+		'elevation': [100.0, 200.0, 101.0, 201.0, 102.0],
+	})
+	buffer = BytesIO()
+	pq.write_table(table, buffer)
+	imported = app.parse_parquet(UploadedFile("b.parquet", buffer.getvalue()))
+	assert [(s.name, s.order, s.point_count) for s in imported] == [("Segment 3", 0, 2), ("Segment 7", 1, 3)]
+	assert imported[0].coordinates == [[10.0, 20.0], [11.0, 21.0]]
+	assert imported[1].coordinates == [[1.0, 4.0], [2.0, 5.0], [3.0, 6.0]]
+	assert imported[1].elevations == [100.0, 101.0, 102.0]
+
+def test_empty_segment_list():
+	data = app.export_to_parquet([])
+	assert pq.read_table(BytesIO(data)).num_rows == 0
+	assert app.parse_parquet(UploadedFile("c.parquet", data)) == []
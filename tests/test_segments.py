@@ -0,0 +1,40 @@
+"""段列表测试：列表位置与 order 不一致时显式报错，而不是删错段"""
+import numpy as np
+import pytest
+
+import app
+
+def make_segments(session_state, count):
+	manager = app.SegmentManager()
+	for i in range(count):
+		t = np.arange(10)
+		session_state.segments.append(app.Segment.from_arrays(f"S{i}", 30 + t * 1e-4, np.full(10, 120.0 + i), np.zeros(10), i))
+	manager.update_segment_orders()
+	return manager
+
+def test_delete_keeps_orders_consistent(session_state):
+	manager = make_segments(session_state, 3)
+	manager.delete_segment(manager.get_segment_by_order(1))
+	assert [s.name for s in session_state.segments] == ["S0", "S2"]
+	assert manager.get_segment_by_order(1).name == "S2"
+
+def test_stale_order_raises(session_state):
+	manager = make_segments(session_state, 3)
+	stale = session_state.segments[2]
+	session_state.segments.insert(0, session_state.segments.pop())
+	with pytest.raises(RuntimeError):
+		manager.get_segment_by_order(0)
+	with pytest.raises(RuntimeError):
+		manager.delete_segment(stale)
+	with pytest.raises(RuntimeError):
+		manager.split_segment(stale)
+	assert len(session_state.segments) == 3
+
+def test_removed_segment_raises(session_state):
+	manager = make_segments(session_state, 2)
+	removed = session_state.segments[0]
+	manager.delete_segment(removed)
+	removed.order = 0
+	with pytest.raises(RuntimeError):
+		manager.delete_segment(removed)
+	assert [s.name for s in session_state.segments] == ["S1"]
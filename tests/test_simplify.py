@@ -0,0 +1,65 @@
+"""轨迹简化测试：与朴素 Douglas-Peucker 对照，并检查点数预算和偏差上界"""
+import numpy as np
+import pytest
+
+import app
+
+def naive_douglas_peucker(x, y, start, end, epsilon, kept):
+	if end - start < 2:
+		return
+	idx = np.arange(start + 1, end)
+	d = app.chord_distances(x, y, np.array([start]), np.array([end]), idx, np.zeros(len(idx), dtype=np.int64))
+	split = idx[d.argmax()]
+	if d.max() > epsilon:
+		kept.add(int(split))
+		naive_douglas_peucker(x, y, start, split, epsilon, kept)
+		naive_douglas_peucker(x, y, split, end, epsilon, kept)
+
+def random_walk(rng, n, scale=5.0):
+	return np.cumsum(rng.normal(0, scale, (n, 2)), axis=0)
+
+def test_simplification_matches_douglas_peucker(monkeypatch):
+	# 关闭中点分割，与朴素 Douglas-Peucker 逐点对照
+	monkeypatch.setattr(app, "SIMPLIFY_DEPTH_FACTOR", 1000)
+	rng = np.random.default_rng(3)
+	for _ in range(60):
+		n = int(rng.integers(3, 300))
+		points = random_walk(rng, n, 10.0)
+		x, y = points[:, 0].copy(), points[:, 1].copy()
+		weights = app.simplification_weights(x, y, np.array([0, n - 1]), n)
+		for epsilon in (0.5, 3.0, 10.0, 30.0):
+			kept = {0, n - 1}
+			naive_douglas_peucker(x, y, 0, n - 1, epsilon, kept)
+			assert set(np.flatnonzero(weights > epsilon).tolist()) == kept
+
+@pytest.mark.parametrize("depth_factor", [app.SIMPLIFY_DEPTH_FACTOR, 0])
+def test_simplification_respects_budget_and_bound(monkeypatch, depth_factor):
+	# depth_factor 为 0 时全部按中点分割，偏差仍不超过被舍弃点的最大有效偏差
+	monkeypatch.setattr(app, "SIMPLIFY_DEPTH_FACTOR", depth_factor)
+	rng = np.random.default_rng(4)
+	theta = np.linspace(0, 20 * np.pi, 5000)
+	x, y = (100 + 20 * theta) * np.cos(theta), (100 + 20 * theta) * np.sin(theta)
+	for budget in (10, 100, 1000):
+		forced = np.array([0, len(x) - 1])
+		weights = app.simplification_weights(x, y, forced, budget - 2)
+		mask = app.select_by_weights(weights, budget)
+		assert mask.sum() <= budget
+		kept = np.flatnonzero(mask)
+		threshold = weights[~mask].max()
+		assert app.simplification_deviation(x, y, kept) <= max(threshold, app.SIMPLIFY_MIN_TOLERANCE) + 1e-9
+	walk = random_walk(rng, 3000)
+	x, y = walk[:, 0].copy(), walk[:, 1].copy()
+	mask = app.select_by_weights(app.simplification_weights(x, y, np.array([0, 2999]), 98), 100)
+	assert mask.sum() <= 100 and mask[0] and mask[-1]
+
+def test_simplify_keeps_boundaries_and_extrema():
+	rng = np.random.default_rng(5)
+	segments = [app.Segment.from_arrays(f"S{i}", 30 + np.cumsum(rng.normal(0, 1e-5, 2000)),
+										120 + np.cumsum(rng.normal(0, 1e-5, 2000)),
+										500 + np.cumsum(rng.normal(0, 1, 2000)), i) for i in range(3)]
+	result = app.simplify_to_budget(segments, total_budget=200)
+	assert sum(len(kept) for kept, _ in result.values()) <= 200
+	for segment in segments:
+		kept, _ = result[id(segment)]
+		_, _, elevations = segment.point_arrays()
+		assert {0, len(elevations) - 1, int(elevations.argmax()), int(elevations.argmin())} <= set(kept.tolist())